@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+from datetime import datetime, timedelta
+
+# Benchmark de carga: genera archivos sintéticos con los mismos nombres que los reales (CRUCE_<n>_<NOMBRE>.TXT y
+# B002537_<n>.TXT), ejecuta carga.py o update.py completos contra una base local (por defecto SQLite) con cada
+# configuración indicada y reporta el tiempo por etapa, las filas/s y el pico de memoria (RSS).
+#
+# Ejemplos:
+#   python benchmark.py --filas 200000 --config "" --config "STREAMING=1" --salida antes.json
+#   python benchmark.py --filas 200000 --config "" --config "STREAMING=1" --comparar antes.json
+#
+# SQLite solo sirve para los caminos compatibles (carga.py con MOTOR_CARGA=insert). update.py, MOTOR_CARGA=load_data
+# o dbapi e INFERIR_TIPOS con STREAMING=1 usan sintaxis de MySQL: para medirlos indicar --url con una base MySQL local.
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Tablas CRUCE que se generan (deben existir en archivo_a_tabla)
+NOMBRES_CRUCE = [
+    "FALLECIDOS",
+    "DATOS_IDENTIFICACION_PF",
+    "PADRON_AUTOMOTORES",
+    "INMUEBLES",
+    "EMBARCACIONES",
+    "AERONAVES",
+    "DESEMPLEO",
+    "EMPLEO_DEPENDIENTE",
+]
+
+def generar_valor(rng, columna, fila):
+    # Valor de una columna no clave; se alternan tipos para ejercitar la normalización y la inferencia de tipos
+    tipo = columna % 5
+    if tipo == 0:
+        return str(rng.randint(0, 10 ** 6))
+    if tipo == 1:
+        return f"{rng.choice(['JOSÉ', 'MUÑOZ', 'PEÑA', 'GÓMEZ', 'ACUÑA'])} {fila}"
+    if tipo == 2:
+        return f"{rng.uniform(0, 100000):.2f}"
+    if tipo == 3:
+        return (datetime(1950, 1, 1) + timedelta(days=rng.randint(0, 25000))).strftime("%d/%m/%Y")
+    return f" {rng.choice(['A', 'B', 'C'])}{fila % 97} "
+
+def generar_archivo(ruta, filas, columnas, codificacion, irregulares, duplicados, rng, id_inicial=1):
+    """
+    Escribe un archivo separado por tabulaciones con ID_PERSONA y `columnas` columnas más. Una fracción
+    `irregulares` de las filas tiene columnas de menos o de más y una fracción `duplicados` repite el
+    ID_PERSONA de una fila anterior. Devuelve la cantidad de filas de datos.
+    """
+    encabezado = ["ID_PERSONA"] + [f"COLUMNA_{i}" for i in range(1, columnas + 1)]
+    with open(ruta, "w", encoding=codificacion, newline="") as f:
+        f.write("\t".join(encabezado) + "\r\n")
+        for fila in range(filas):
+            id_persona = id_inicial + fila
+            if fila and rng.random() < duplicados:
+                id_persona = id_inicial + rng.randrange(fila)
+            valores = [str(id_persona)] + [generar_valor(rng, columna, fila) for columna in range(columnas)]
+            if rng.random() < irregulares:
+                if rng.random() < 0.5:
+                    valores = valores[:rng.randint(1, len(valores) - 1)]
+                else:
+                    valores += ["EXTRA"] * rng.randint(1, 3)
+            f.write("\t".join(valores) + "\r\n")
+    return filas
+
+def generar_datos(carpeta, args):
+    # Generar los archivos CRUCE y las partes de B002537 en la carpeta indicada
+    rng = random.Random(args.semilla)
+    total = 0
+    for numero, nombre in enumerate(NOMBRES_CRUCE[:args.archivos], start=1):
+        ruta = os.path.join(carpeta, f"CRUCE_{numero}_{nombre}.TXT")
+        total += generar_archivo(ruta, args.filas, args.columnas, args.codificacion, args.irregulares, args.duplicados, rng)
+    for parte in range(1, args.partes + 1):
+        # Las partes de B002537 van a la misma tabla: los ID_PERSONA continúan de una parte a la siguiente
+        ruta = os.path.join(carpeta, f"B002537_{parte}.TXT")
+        total += generar_archivo(ruta, args.filas, args.columnas, args.codificacion, args.irregulares, args.duplicados,
+                                 rng, id_inicial=1 + (parte - 1) * args.filas)
+    return total
+
+def leer_config(texto):
+    # "MOTOR_CARGA=dbapi,STREAMING=1" -> {"MOTOR_CARGA": "dbapi", "STREAMING": "1"}
+    return dict(par.split("=", 1) for par in texto.split(",") if par.strip())
+
+def pico_rss_mb():
+    # Pico de memoria residente del proceso (no disponible en Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # En Linux ru_maxrss está en KB y en macOS en bytes
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+def ejecutar_hijo(script, carpeta, ruta_resultado):
+    """
+    Ejecuta el script en este proceso (lanzado por ejecutar_escenario con la configuración en el entorno)
+    y guarda el resultado en ruta_resultado.
+    """
+    # No leer el .env: la configuración de cada escenario es la que llega en el entorno
+    import dotenv
+    dotenv.load_dotenv = lambda *args, **kwargs: False
+
+    spec = importlib.util.spec_from_file_location(script[:-3], os.path.join(DIRECTORIO, script))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+
+    if modulo.engine.dialect.name == "sqlite":
+        # Con WAL las lecturas del esquema desde otra conexión (obtener_plan, create_all) no esperan a la transacción de carga
+        from sqlalchemy import event
+
+        @event.listens_for(modulo.engine, "connect")
+        def activar_wal(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    inicio = time.perf_counter()
+    modulo.procesar_y_cargar_archivos(carpeta)
+    segundos = time.perf_counter() - inicio
+    # Tiempo por etapa: las mediciones de medir_etapa/registrar_etapa de los scripts, las mismas de su resumen y
+    # del reporte (con WORKERS > 1 se suman entre hilos y pueden superar el tiempo total)
+    tiempos = {etapa: datos["segundos"] for etapa, datos in modulo.totalizar_etapas().items()}
+
+    from sqlalchemy import inspect, text
+    filas_bd = {}
+    with modulo.engine.connect() as connection:
+        for tabla in inspect(modulo.engine).get_table_names():
+            filas_bd[tabla] = connection.execute(text(f"SELECT COUNT(*) FROM {tabla}")).scalar()
+
+    filas = sum(modulo.filas_leidas.values())
+    tiempos["otros"] = max(0.0, segundos - sum(tiempos.values()))
+    resultado = {
+        "segundos": segundos,
+        "filas": filas,
+        "filas_por_segundo": filas / segundos if segundos else 0,
+        "rss_max_mb": pico_rss_mb(),
+        "etapas": tiempos,
+        "filas_bd": filas_bd,
+    }
+    with open(ruta_resultado, "w", encoding="utf-8") as f:
+        json.dump(resultado, f)
+
+def ejecutar_escenario(script, carpeta, url, config, detalle):
+    # Cada escenario corre en un proceso nuevo, para que el pico de RSS y las opciones leídas al importar sean propios
+    entorno = dict(os.environ, DB_URL=url, **config)
+    ruta_resultado = os.path.join(os.path.dirname(carpeta), "resultado.json")
+    if os.path.exists(ruta_resultado):
+        os.remove(ruta_resultado)
+    salida = None if detalle else subprocess.DEVNULL
+    proceso = subprocess.run([sys.executable, os.path.abspath(__file__), "--hijo", script, carpeta, ruta_resultado],
+                             env=entorno, stdout=salida)
+    if proceso.returncode != 0 or not os.path.exists(ruta_resultado):
+        return None
+    with open(ruta_resultado, encoding="utf-8") as f:
+        return json.load(f)
+
+def obtener_commit():
+    # Commit actual, para poder comparar resultados entre versiones
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORIO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def imprimir_resultado(nombre, resultado, anterior=None):
+    if resultado is None:
+        print(f"\n{nombre}: ERROR (ejecutar con --detalle para ver la salida del script)")
+        return
+    rss = f"{resultado['rss_max_mb']:.0f} MB" if resultado["rss_max_mb"] is not None else "n/d"
+    print(f"\n{nombre}: {resultado['filas']} filas en {resultado['segundos']:.2f} s "
+          f"({resultado['filas_por_segundo']:.0f} filas/s), pico RSS {rss}")
+    if anterior:
+        cambio = (resultado["filas_por_segundo"] / anterior["filas_por_segundo"] - 1) * 100 if anterior["filas_por_segundo"] else 0
+        print(f"  antes: {anterior['filas_por_segundo']:.0f} filas/s en {anterior['segundos']:.2f} s ({cambio:+.1f}% filas/s)")
+    for etapa, segundos in sorted(resultado["etapas"].items(), key=lambda item: -item[1]):
+        porcentaje = segundos / resultado["segundos"] * 100 if resultado["segundos"] else 0
+        print(f"  - {etapa}: {segundos:.2f} s ({porcentaje:.0f}%)")
+    print("  filas en BD: " + ", ".join(f"{tabla}={filas}" for tabla, filas in sorted(resultado["filas_bd"].items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga.py / update.py con archivos sintéticos")
+    parser.add_argument("--script", default="carga.py", choices=["carga.py", "update.py"])
+    parser.add_argument("--config", action="append",
+                        help='opciones de un escenario, por ejemplo "MOTOR_CARGA=dbapi,STREAMING=1" ("" = valores por defecto); se puede repetir')
+    parser.add_argument("--filas", type=int, default=100000, help="filas por archivo")
+    parser.add_argument("--columnas", type=int, default=10, help="columnas además de ID_PERSONA")
+    parser.add_argument("--archivos", type=int, default=2, help=f"archivos CRUCE (hasta {len(NOMBRES_CRUCE)})")
+    parser.add_argument("--partes", type=int, default=2, help="partes de B002537")
+    parser.add_argument("--codificacion", default="windows-1252", choices=["windows-1252", "utf-8"])
+    parser.add_argument("--irregulares", type=float, default=0.01, help="fracción de filas con columnas de menos o de más")
+    parser.add_argument("--duplicados", type=float, default=0.0, help="fracción de filas con ID_PERSONA repetido")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--repeticiones", type=int, default=1, help="se informa la repetición más rápida")
+    parser.add_argument("--url", help="URL de la base (por defecto una base SQLite nueva en cada ejecución)")
+    parser.add_argument("--salida", help="guardar los resultados en este archivo JSON")
+    parser.add_argument("--comparar", help="archivo JSON de una ejecución anterior para comparar")
+    parser.add_argument("--detalle", action="store_true", help="mostrar la salida de los scripts")
+    args = parser.parse_args()
+
+    configs = args.config or [""]
+    anteriores = {}
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anteriores = {(r["script"], r["config"]): r for r in json.load(f)["resultados"]}
+
+    trabajo = tempfile.mkdtemp(prefix="benchmark_carga_")
+    try:
+        carpeta = os.path.join(trabajo, "datos")
+        os.makedirs(carpeta)
+        inicio = time.perf_counter()
+        filas = generar_datos(carpeta, args)
+        print(f"Generadas {filas} filas en {args.archivos + args.partes} archivos ({args.codificacion}) "
+              f"en {time.perf_counter() - inicio:.1f} s")
+
+        resultados = []
+        for config in configs:
+            mejor = None
+            for _ in range(args.repeticiones):
+                url = args.url
+                if url is None:
+                    ruta_bd = os.path.join(trabajo, "benchmark.sqlite")
+                    for ruta in (ruta_bd, ruta_bd + "-wal", ruta_bd + "-shm"):
+                        if os.path.exists(ruta):
+                            os.remove(ruta)
+                    url = f"sqlite:///{ruta_bd}"
+                resultado = ejecutar_escenario(args.script, carpeta, url, leer_config(config), args.detalle)
+                if resultado and (mejor is None or resultado["segundos"] < mejor["segundos"]):
+                    mejor = resultado
+            imprimir_resultado(f"{args.script} [{config or 'por defecto'}]", mejor, anteriores.get((args.script, config)))
+            if mejor:
+                resultados.append(dict(mejor, script=args.script, config=config))
+    finally:
+        shutil.rmtree(trabajo, ignore_errors=True)
+
+    if args.salida:
+        parametros = {clave: valor for clave, valor in vars(args).items() if clave not in ("salida", "comparar", "detalle", "url")}
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"commit": obtener_commit(), "fecha": datetime.now().isoformat(timespec="seconds"),
+                       "parametros": parametros, "resultados": resultados}, f, indent=2)
+        print(f"\nResultados guardados en: {args.salida}")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--hijo":
+        ejecutar_hijo(*sys.argv[2:])
+    else:
+        main()
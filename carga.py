@@ -1,9 +1,36 @@
 import os
+import sys
 import re
-import petl as etl
+import io
+import csv
+import codecs
+import gzip
+import zipfile
+import time
+import threading
+import queue
+import json
+import hashlib
+import itertools
+import ctypes
+from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
+try:
+    import resource
+except ImportError:  # Windows: el pico de memoria se consulta con GetProcessMemoryInfo
+    resource = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo se usa para la caché Parquet (CACHE_PARQUET=1)
+    pa = pq = None
 import pandas as pd
-from sqlalchemy import create_engine, text, inspect, Table, Column, Integer, String, MetaData
+import numpy as np
+from sqlalchemy import create_engine, text, inspect, Table, Column, Integer, BigInteger, Float, String, Text, DateTime, MetaData, bindparam
 from sqlalchemy.exc import SQLAlchemyError, DBAPIError
+from sqlalchemy.dialects import mysql
+from sqlalchemy.sql import sqltypes
 from dotenv import load_dotenv
 
 # Cargar variables de entorno desde un archivo .env
@@ -15,9 +42,88 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_NAME = os.getenv("DB_NAME")
 PATH = os.getenv("PATH")
+# URL de conexión completa (opcional), reemplaza a los datos anteriores; por ejemplo una base SQLite local para benchmark.py
+DB_URL = os.getenv("DB_URL")
 
-# Crear conexión a la base de datos
-engine = create_engine(f'mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}')
+# Lectura por bloques: con STREAMING=1 los archivos se leen y cargan en bloques de TAMANO_BLOQUE filas,
+# de modo que la memoria usada depende del tamaño del bloque y no del tamaño del archivo
+STREAMING = os.getenv("STREAMING", "0") == "1"
+TAMANO_BLOQUE = int(os.getenv("TAMANO_BLOQUE", "100000"))
+
+# Pipeline: con PIPELINE=1 la lectura, el parseo y la conversión de tipos del bloque siguiente se hacen en otro hilo
+# mientras se inserta el bloque actual; COLA_PIPELINE es la cantidad máxima de bloques preparados en espera
+PIPELINE = os.getenv("PIPELINE", "0") == "1"
+COLA_PIPELINE = int(os.getenv("COLA_PIPELINE", "2"))
+
+# Archivo limpio: "txt" (_limpio.TXT, por defecto), "gz" (_limpio.TXT.gz comprimido) o "no" (no se escribe).
+# LOAD DATA carga desde el _limpio.TXT sin comprimir, así que con "gz" o "no" se usa el INSERT
+LIMPIO = os.getenv("LIMPIO", "txt").lower()
+
+# Caché Parquet: con CACHE_PARQUET=1 los datos ya limpios de cada archivo se guardan en formato Parquet
+# (requiere pyarrow), identificados por el hash del archivo; si el archivo no cambió, las siguientes ejecuciones
+# los leen de la caché sin detectar la codificación, parsear ni quitar espacios (por defecto en <PATH>/cache_limpio)
+CACHE_PARQUET = os.getenv("CACHE_PARQUET", "0") == "1"
+RUTA_CACHE = os.getenv("RUTA_CACHE", "")
+
+# Cantidad de tablas que se procesan en paralelo (cada worker usa sus propias conexiones del engine)
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Índices secundarios: con INDICES=1, al terminar la carga se crean los índices de indices_por_tabla en las tablas
+# cargadas, WORKERS_INDICES tablas a la vez y (en MySQL) con DDL en línea, sin bloquear las consultas
+INDICES = os.getenv("INDICES", "0") == "1"
+WORKERS_INDICES = int(os.getenv("WORKERS_INDICES", "4"))
+
+# Particiones: con PARTICIONES=1 las tablas de particiones_por_tabla se crean (en MySQL) con PARTITION BY HASH sobre
+# su clave primaria y cada bloque se reparte por partición entre WORKERS_PARTICIONES conexiones que insertan a la vez
+PARTICIONES = os.getenv("PARTICIONES", "0") == "1"
+WORKERS_PARTICIONES = int(os.getenv("WORKERS_PARTICIONES", "4"))
+
+# Manifiesto de cargas: con MANIFIESTO=1 se registra tamaño, fecha y hash de los archivos cargados en cada tabla
+# y se omiten las tablas cuyos archivos no cambiaron (por defecto en <PATH>/manifiesto_carga.json)
+MANIFIESTO = os.getenv("MANIFIESTO", "0") == "1"
+RUTA_MANIFIESTO = os.getenv("RUTA_MANIFIESTO", "")
+
+# Carga reanudable: con REANUDABLE=1 se confirma (COMMIT) cada LOTES_POR_COMMIT lotes en lugar de una sola
+# transacción por archivo, registrando en la tabla TABLA_CHECKPOINT las filas ya confirmadas y el hash del archivo;
+# si la carga se interrumpe, la siguiente ejecución la reanuda desde esa fila (carga.py carga en la tabla sombra)
+REANUDABLE = os.getenv("REANUDABLE", "0") == "1"
+LOTES_POR_COMMIT = int(os.getenv("LOTES_POR_COMMIT", "100"))
+TABLA_CHECKPOINT = "checkpoint_carga"
+
+# Nombre del script, para el reporte de la ejecución
+SCRIPT = "carga"
+
+# Reporte de la ejecución: con REPORTE=1 se guarda un JSON con el tiempo, filas, bytes y memoria de cada etapa por archivo
+# y la latencia de los lotes insertados (por defecto en <PATH>/reporte_<script>_<fecha>.json)
+REPORTE = os.getenv("REPORTE", "0") == "1"
+RUTA_REPORTE = os.getenv("RUTA_REPORTE", "")
+
+# Motor de carga: "insert" (INSERT por lotes), "dbapi" (INSERT multi-fila directo al driver, con lotes según
+# max_allowed_packet) o "load_data" (LOAD DATA LOCAL INFILE desde el archivo _limpio.TXT)
+MOTOR_CARGA = os.getenv("MOTOR_CARGA", "insert")
+
+# Tabla sombra: con TABLA_SOMBRA=1 cada tabla se carga en <tabla>__nueva sin clave primaria, la clave se crea una
+# sola vez al terminar y la tabla nueva reemplaza a la anterior con un único RENAME TABLE (atómico en MySQL)
+TABLA_SOMBRA = os.getenv("TABLA_SOMBRA", "0") == "1"
+
+# Claves duplicadas o inválidas: con CLAVES_DUPLICADAS="primero" o "ultimo" se inserta la primera o la última fila
+# de cada clave repetida en un archivo y con "rechazar" no se inserta ninguna; las filas con la clave vacía o no
+# numérica tampoco se insertan. Las filas no insertadas que no quedan descartadas por "primero" o "ultimo" se
+# escriben en <archivo>_rechazos.TXT (por defecto en <PATH>). Con "no" (por defecto) las filas no se revisan
+CLAVES_DUPLICADAS = os.getenv("CLAVES_DUPLICADAS", "no").lower()
+RUTA_RECHAZOS = os.getenv("RUTA_RECHAZOS", "")
+
+# Representación compacta: con COMPACTAR=1 el DataFrame de un archivo leído completo (sin STREAMING) guarda la clave
+# entera como int64 y cada columna de texto con pocos valores distintos como categórica (cada valor una sola vez y
+# un código por fila); al final se informa la memoria de los datos de cada tabla antes y después de compactarlos
+COMPACTAR = os.getenv("COMPACTAR", "0") == "1"
+
+# Crear conexión a la base de datos (LOAD DATA LOCAL INFILE requiere habilitarlo también del lado del cliente)
+engine = create_engine(
+    DB_URL or f'mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}',
+    connect_args={"allow_local_infile": True} if MOTOR_CARGA == "load_data" else {},
+    pool_size=max(5, WORKERS * (2 + (WORKERS_PARTICIONES if PARTICIONES else 0)))
+)
 
 # Mapeo de nombres de archivos a nombres de tablas (sin el número)
 archivo_a_tabla = {
@@ -49,36 +155,520 @@ archivo_a_tabla = {
 # Lista de codificaciones conocidas
 CODIFICACIONES_CONOCIDAS = ['windows-1252', 'utf-8', 'ISO-8859-1', 'ascii']
 
+# Fines de línea que separa str.splitlines además de \r\n, \r y \n (el lector en C de pandas solo reconoce estos
+# tres, así que parsear_texto pasa los demás a \n)
+OTROS_FINES_DE_LINEA = "\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+# Inferencia de tipos: con INFERIR_TIPOS=1 cada columna se crea con el tipo MySQL más angosto que admite sus
+# valores (TINYINT/INT/BIGINT, DECIMAL, DATE/DATETIME, CHAR/VARCHAR) en lugar de VARCHAR(255)
+INFERIR_TIPOS = os.getenv("INFERIR_TIPOS", "0") == "1"
+
+# Tipos fijos por tabla y columna que reemplazan a los inferidos, escritos como en MySQL
+tipos_por_tabla = {
+    # "data_general": {"cuit": "BIGINT"},
+}
+
+# Columnas con índice secundario por tabla, además de id_persona, que se indexa en todas las tablas donde no es la
+# clave primaria (las columnas que no están en la tabla o que son su clave primaria se ignoran)
+indices_por_tabla = {
+    "personas_domicilios": ["id_domicilio"],
+}
+
+# Cantidad de particiones por tabla con PARTICIONES=1 (solo las tablas más grandes; la clave primaria tiene que ser entera)
+particiones_por_tabla = {
+    "data_general": 8,
+    "personas_domicilios": 8,
+}
+
+# Formatos de fecha reconocidos (formato de Python: formato de STR_TO_DATE en MySQL)
+FORMATOS_FECHA = {"%Y-%m-%d": "%Y-%m-%d", "%d/%m/%Y": "%d/%m/%Y"}
+FORMATOS_FECHA_HORA = {"%Y-%m-%d %H:%M:%S": "%Y-%m-%d %H:%i:%s", "%d/%m/%Y %H:%M:%S": "%d/%m/%Y %H:%i:%s"}
+
+# Con COMPACTAR=1 una columna de texto pasa a categórica si sus valores distintos son a lo sumo esta proporción de
+# las filas (estimada primero sobre las primeras MUESTRA_CATEGORIAS filas, para no recorrer las que no convienen)
+PROPORCION_CATEGORIAS = 0.5
+MUESTRA_CATEGORIAS = 10000
+
+# Cantidad de bytes del comienzo de cada archivo que se inspeccionan para decidir la codificación
+MUESTRA_CODIFICACION = int(os.getenv("MUESTRA_CODIFICACION", str(1024 * 1024)))
+
+# Codificación decidida por tabla (prefijo de archivo_a_tabla); los siguientes archivos de la misma tabla la reutilizan
+codificaciones_por_tabla = {}
+
+# Filas y segundos acumulados por motor de carga, para informar el rendimiento en el resumen final
+rendimiento_motores = {}
+
+# Protege las estadísticas compartidas cuando se procesan varias tablas en paralelo
+bloqueo_estadisticas = threading.Lock()
+
+# Manifiesto de cargas y ruta donde se guarda (se cargan al comenzar el proceso si MANIFIESTO=1)
+manifiesto = {}
+ruta_manifiesto = None
+
+# Filas leídas por archivo, para registrarlas en el manifiesto
+filas_leidas = {}
+
+# Métricas por archivo: etapas (tiempo, filas, bytes, pico de memoria), latencia de cada lote insertado y totales
+metricas_archivos = {}
+
+# Archivo que procesa cada hilo, para asignar las métricas de las etapas al archivo correspondiente
+contexto_hilo = threading.local()
+
+# Estado de local_infile en el servidor (se consulta una sola vez por ejecución)
+local_infile_habilitado = None
+
+# max_allowed_packet del servidor, para dimensionar los INSERT multi-fila del motor "dbapi" (se consulta una sola vez)
+max_allowed_packet = None
+
+# Archivos de datos que se leen desde un .zip o un .gz sin extraerlos: ruta en la carpeta (como si estuvieran
+# extraídos) -> archivo comprimido, miembro dentro del .zip (None para .gz) y tamaño
+archivos_comprimidos = {}
+
+# Carpeta de la caché Parquet (None si no se usa) e índice con la firma de cada archivo, para no volver a calcular
+# el hash de los archivos cuyo tamaño y fecha no cambiaron
+carpeta_cache = None
+indice_cache = {}
+
+# Índices secundarios creados al terminar la carga: columnas, segundos y tamaño por tabla (ver crear_indices)
+indices_creados = {}
+
+# Filas cargadas en cada partición de las tablas particionadas (ver PARTICIONES)
+filas_particiones = {}
+
+# Memoria (bytes) de los datos de cada tabla antes y después de compactarlos (ver COMPACTAR)
+memoria_tablas = {}
+
+# Carpeta de los archivos de rechazos (None si CLAVES_DUPLICADAS="no"; ver depurar_claves)
+carpeta_rechazos = None
+
+# Planes de carga por tabla (clave primaria, tipos, conversiones y sentencias armadas), tomados del esquema de la BD
+# una sola vez por ejecución; None indica que la tabla no existe
+planes_carga = {}
+
+def obtener_tabla(archivo):
+    # Utilizar expresiones regulares para identificar el patrón en el nombre del archivo
+    match_cruce = re.match(r"CRUCE_\d+_(.+)\.TXT", archivo)
+    match_b = re.match(r"B002537_\d+\.TXT", archivo)
+
+    if match_cruce:
+        # Construir la clave sin el número para archivos CRUCE_
+        clave = f"CRUCE_{match_cruce.group(1)}"
+    elif match_b:
+        # Clave fija para archivos B002537_
+        clave = "B002537_"
+    else:
+        return None
+    return archivo_a_tabla.get(clave)
+
+def listar_archivos(carpeta):
+    """
+    Nombres de los archivos de la carpeta, incluidos los archivos de datos que vienen dentro de un .zip o comprimidos
+    con .gz (reconocidos con obtener_tabla). Esos se registran en archivos_comprimidos y se leen descomprimiendo al
+    vuelo con abrir_archivo, sin escribirlos en disco. Si el mismo archivo también está extraído se usa el extraído.
+    """
+    archivos_comprimidos.clear()
+    nombres = sorted(os.listdir(carpeta))
+    archivos = {nombre for nombre in nombres if not nombre.lower().endswith((".zip", ".gz"))}
+    for nombre in nombres:
+        ruta = os.path.join(carpeta, nombre)
+        try:
+            if nombre.lower().endswith(".zip"):
+                with zipfile.ZipFile(ruta) as contenedor:
+                    miembros = [(os.path.basename(m.filename), m.filename, m.file_size) for m in contenedor.infolist() if not m.is_dir()]
+            elif nombre.lower().endswith(".gz"):
+                miembros = [(nombre[:-3], None, os.path.getsize(ruta))]
+            else:
+                continue
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"No se pudo leer el archivo comprimido {nombre}: {e}")
+            continue
+        for archivo, miembro, tamano in miembros:
+            if not obtener_tabla(archivo):
+                continue
+            if archivo in archivos:
+                print(f"Aviso: {archivo} de {nombre} se ignora porque ya está en la carpeta o en otro archivo comprimido.")
+                continue
+            archivos.add(archivo)
+            archivos_comprimidos[os.path.join(carpeta, archivo)] = {"contenedor": ruta, "miembro": miembro, "tamano": tamano}
+    return sorted(archivos)
+
+@contextmanager
+def abrir_archivo(ruta_archivo):
+    # Abrir un archivo de datos en modo binario; si viene en un .zip o .gz se descomprime a medida que se lee
+    comprimido = archivos_comprimidos.get(ruta_archivo)
+    if comprimido is None:
+        with open(ruta_archivo, 'rb') as f:
+            yield f
+    elif comprimido["miembro"] is None:
+        with gzip.open(comprimido["contenedor"], 'rb') as f:
+            yield f
+    else:
+        with zipfile.ZipFile(comprimido["contenedor"]) as contenedor, contenedor.open(comprimido["miembro"]) as f:
+            yield f
+
+def ruta_en_disco(ruta_archivo):
+    # Archivo que está realmente en disco: el .zip o .gz si el archivo de datos viene comprimido
+    comprimido = archivos_comprimidos.get(ruta_archivo)
+    return comprimido["contenedor"] if comprimido else ruta_archivo
+
+def tamano_archivo(ruta_archivo):
+    # Tamaño del archivo de datos (sin comprimir si viene en un .zip; el del .gz si viene comprimido con gzip)
+    comprimido = archivos_comprimidos.get(ruta_archivo)
+    return comprimido["tamano"] if comprimido else os.path.getsize(ruta_archivo)
+
+def cargar_manifiesto(carpeta):
+    global manifiesto, ruta_manifiesto
+    ruta_manifiesto = RUTA_MANIFIESTO or os.path.join(carpeta, "manifiesto_carga.json")
+    if os.path.exists(ruta_manifiesto):
+        with open(ruta_manifiesto, 'r', encoding='utf-8') as f:
+            manifiesto = json.load(f)
+    else:
+        manifiesto = {}
+
+def guardar_manifiesto():
+    # Se escribe primero un archivo temporal para no dejar el manifiesto a medio escribir si el proceso se corta
+    with bloqueo_estadisticas:
+        temporal = ruta_manifiesto + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+        os.replace(temporal, ruta_manifiesto)
+
+def hash_archivo(ruta_archivo):
+    h = hashlib.sha256()
+    with abrir_archivo(ruta_archivo) as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def firma_archivo(ruta_archivo, anterior=None):
+    """
+    Devuelve tamaño, fecha de modificación y hash del contenido de un archivo. Si el tamaño y la fecha coinciden
+    con los de la firma `anterior` se reutiliza su hash sin volver a leer el archivo.
+    """
+    # Para un archivo comprimido la fecha es la del .zip o .gz que lo contiene
+    tamano, mtime = tamano_archivo(ruta_archivo), os.stat(ruta_en_disco(ruta_archivo)).st_mtime
+    if anterior and anterior["tamano"] == tamano and anterior["mtime"] == mtime:
+        contenido = anterior["hash"]
+    else:
+        contenido = hash_archivo(ruta_archivo)
+    return {"tamano": tamano, "mtime": mtime, "hash": contenido}
+
+def firmar_archivos(carpeta, archivos, nombre_tabla):
+    # Firma de cada archivo, reutilizando los hashes registrados en el manifiesto
+    anteriores = manifiesto.get(nombre_tabla, {}).get("archivos", {})
+    return {archivo: firma_archivo(os.path.join(carpeta, archivo), anteriores.get(archivo)) for archivo in archivos}
+
+def tabla_sin_cambios(nombre_tabla, firmas):
+    entrada = manifiesto.get(nombre_tabla)
+    # Solo se omite si la última carga de la tabla la hizo carga.py (update.py no deja la tabla igual al archivo)
+    if not entrada or entrada.get("script") != "carga":
+        return False
+    anteriores = entrada["archivos"]
+    return set(anteriores) == set(firmas) and all(anteriores[a]["hash"] == firmas[a]["hash"] for a in firmas)
+
+def actualizar_manifiesto(nombre_tabla, firmas, resultados_grupo):
+    # Registrar la carga solo si todos los archivos de la tabla se cargaron bien; si no, se olvida la entrada
+    with bloqueo_estadisticas:
+        if all(resultados_grupo.values()):
+            manifiesto[nombre_tabla] = {
+                "script": "carga",
+                "fecha": datetime.now().isoformat(timespec='seconds'),
+                "filas": sum(filas_leidas.get(archivo, 0) for archivo in firmas),
+                "archivos": firmas
+            }
+        else:
+            manifiesto.pop(nombre_tabla, None)
+    guardar_manifiesto()
+
+def preparar_checkpoints():
+    # Crear la tabla de checkpoints (compartida por carga.py y update.py) si no existe
+    metadata = MetaData()
+    Table(TABLA_CHECKPOINT, metadata,
+          Column("script", String(20), primary_key=True),
+          Column("tabla", String(64), primary_key=True),
+          Column("archivo", String(255)),
+          Column("hash", String(64)),
+          Column("tamano", BigInteger),
+          Column("mtime", Float(53)),
+          Column("filas", BigInteger),
+          Column("perfiles", Text),
+          Column("fecha", DateTime))
+    metadata.create_all(engine)
+
+def leer_checkpoint(archivo, ruta_archivo, nombre_tabla):
+    """
+    Devuelve el checkpoint de la carga de un archivo: su firma y las filas ya confirmadas ("filas", 0 si la carga
+    empieza de cero). Hay un solo checkpoint por tabla; la carga se reanuda si es de este mismo archivo, con el
+    mismo contenido (hash) y la tabla sombra en la que se estaba cargando sigue existiendo.
+    """
+    with engine.connect() as connection:
+        fila = connection.execute(text(f"""
+            SELECT archivo, hash, tamano, mtime, filas, perfiles, fecha FROM {TABLA_CHECKPOINT}
+            WHERE script = :script AND tabla = :tabla
+        """), {"script": SCRIPT, "tabla": nombre_tabla}).mappings().first()
+    anterior = fila if fila and fila["archivo"] == archivo else None
+    with medir_etapa("checkpoint"):
+        firma = firma_archivo(ruta_archivo, anterior and {"tamano": anterior["tamano"], "mtime": anterior["mtime"], "hash": anterior["hash"]})
+    checkpoint = {"tabla": nombre_tabla, "archivo": archivo, "firma": firma, "filas": 0, "perfiles": None}
+    if anterior and anterior["hash"] == firma["hash"] and anterior["filas"] and obtener_plan(nombre_sombra(nombre_tabla)) is not None:
+        checkpoint["filas"] = anterior["filas"]
+        checkpoint["perfiles"] = json.loads(anterior["perfiles"]) if anterior["perfiles"] else None
+        print(f"Se reanuda la carga de {archivo} desde la fila {anterior['filas']} (checkpoint del {anterior['fecha']}).")
+    return checkpoint
+
+def guardar_checkpoint(connection, checkpoint, filas, perfiles=None):
+    # Registrar las filas del archivo ya cargadas, en la misma transacción que esas filas
+    parametros = {"script": SCRIPT, "tabla": checkpoint["tabla"]}
+    connection.execute(text(f"DELETE FROM {TABLA_CHECKPOINT} WHERE script = :script AND tabla = :tabla"), parametros)
+    connection.execute(text(f"""
+        INSERT INTO {TABLA_CHECKPOINT} (script, tabla, archivo, hash, tamano, mtime, filas, perfiles, fecha)
+        VALUES (:script, :tabla, :archivo, :hash, :tamano, :mtime, :filas, :perfiles, :fecha)
+    """), {**parametros, "archivo": checkpoint["archivo"], **checkpoint["firma"], "filas": filas,
+           "perfiles": json.dumps(perfiles) if perfiles else None, "fecha": datetime.now().replace(microsecond=0)})
+
+def confirmar_checkpoint(connection, trans, checkpoint, filas, perfiles=None):
+    # Confirmar las filas cargadas junto con el checkpoint y empezar una nueva transacción
+    with medir_etapa("checkpoint"):
+        guardar_checkpoint(connection, checkpoint, filas, perfiles)
+        trans.commit()
+    checkpoint["filas"] = filas
+    return connection.begin()
+
+def borrar_checkpoint(connection, nombre_tabla):
+    # La carga del archivo terminó: la próxima ejecución empieza de cero
+    connection.execute(text(f"DELETE FROM {TABLA_CHECKPOINT} WHERE script = :script AND tabla = :tabla"),
+                       {"script": SCRIPT, "tabla": nombre_tabla})
+
+def memoria_pico_mb():
+    # Pico de memoria del proceso hasta el momento, en MB (None si no se puede consultar)
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # En Linux ru_maxrss está en KB y en macOS en bytes
+        return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+    if os.name == "nt":
+        class ContadoresMemoria(ctypes.Structure):
+            _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong)] + [
+                (campo, ctypes.c_size_t) for campo in ("PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                                                       "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                                                       "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+        contadores = ContadoresMemoria()
+        contadores.cb = ctypes.sizeof(contadores)
+        proceso = ctypes.c_void_p(-1)  # Pseudo-handle del proceso actual
+        if ctypes.windll.psapi.GetProcessMemoryInfo(proceso, ctypes.byref(contadores), contadores.cb):
+            return contadores.PeakWorkingSetSize / (1024 * 1024)
+    return None
+
+def registrar_archivo(archivo, nombre_tabla, ruta_archivo, cargado, segundos):
+    # Datos generales del archivo para el reporte
+    with bloqueo_estadisticas:
+        metricas = obtener_metricas(archivo)
+        metricas.update({
+            "tabla": nombre_tabla,
+            "cargado": bool(cargado),
+            "bytes": tamano_archivo(ruta_archivo),
+            "filas": filas_leidas.get(archivo, 0),
+            "segundos": segundos,
+        })
+
+def obtener_metricas(archivo):
+    # Métricas del archivo (se crean la primera vez); llamar con bloqueo_estadisticas tomado
+    return metricas_archivos.setdefault(archivo, {"etapas": {}, "lotes": []})
+
+def registrar_etapa(etapa, segundos, filas=0, bytes_procesados=0):
+    # Acumular una medición de la etapa en el archivo que procesa este hilo (o en "(general)" fuera de un archivo)
+    memoria = memoria_pico_mb()
+    with bloqueo_estadisticas:
+        etapas = obtener_metricas(getattr(contexto_hilo, "archivo", None) or "(general)")["etapas"]
+        datos = etapas.setdefault(etapa, {"segundos": 0.0, "filas": 0, "bytes": 0, "llamadas": 0, "memoria_pico_mb": None})
+        datos["segundos"] += segundos
+        datos["filas"] += filas
+        datos["bytes"] += bytes_procesados
+        datos["llamadas"] += 1
+        if memoria is not None:
+            datos["memoria_pico_mb"] = max(datos["memoria_pico_mb"] or 0, memoria)
+
+@contextmanager
+def medir_etapa(etapa):
+    # Medir el bloque como una etapa; en el diccionario que devuelve se pueden informar las filas y bytes procesados
+    medicion = {"filas": 0, "bytes": 0}
+    inicio = time.perf_counter()
+    try:
+        yield medicion
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio, medicion["filas"], medicion["bytes"])
+
+def registrar_lote(segundos):
+    # Registrar la latencia de un lote (una sentencia de carga) del archivo que procesa este hilo
+    with bloqueo_estadisticas:
+        obtener_metricas(getattr(contexto_hilo, "archivo", None) or "(general)")["lotes"].append(segundos)
+
+def resumir_lotes(latencias):
+    # Cantidad de lotes y percentiles de latencia en milisegundos
+    if not latencias:
+        return None
+    ordenadas = sorted(latencias)
+    resumen = {"lotes": len(ordenadas)}
+    for percentil in (50, 90, 99):
+        resumen[f"p{percentil}_ms"] = ordenadas[min(len(ordenadas) - 1, len(ordenadas) * percentil // 100)] * 1000
+    resumen["max_ms"] = ordenadas[-1] * 1000
+    return resumen
+
+def totalizar_etapas():
+    # Sumar las etapas de todos los archivos (el pico de memoria es el máximo)
+    totales = {}
+    for metricas in metricas_archivos.values():
+        for etapa, datos in metricas["etapas"].items():
+            total = totales.setdefault(etapa, {"segundos": 0.0, "filas": 0, "bytes": 0, "llamadas": 0, "memoria_pico_mb": None})
+            for campo in ("segundos", "filas", "bytes", "llamadas"):
+                total[campo] += datos[campo]
+            if datos["memoria_pico_mb"] is not None:
+                total["memoria_pico_mb"] = max(total["memoria_pico_mb"] or 0, datos["memoria_pico_mb"])
+    return totales
+
+def imprimir_metricas(segundos_totales):
+    # Resumen por etapa de todos los archivos (con WORKERS > 1 los tiempos de las etapas se suman entre hilos)
+    totales = totalizar_etapas()
+    if not totales:
+        return
+    print(f"\nTiempo por etapa (total {segundos_totales:.1f} s):")
+    for etapa, datos in sorted(totales.items(), key=lambda item: -item[1]["segundos"]):
+        detalle = f" - {etapa}: {datos['segundos']:.1f} s"
+        if datos["filas"]:
+            filas_por_segundo = datos["filas"] / datos["segundos"] if datos["segundos"] else 0
+            detalle += f", {datos['filas']} filas ({filas_por_segundo:.0f} filas/s)"
+        if datos["bytes"]:
+            detalle += f", {datos['bytes'] / (1024 * 1024):.1f} MB"
+        if datos["memoria_pico_mb"] is not None:
+            detalle += f", pico de memoria {datos['memoria_pico_mb']:.0f} MB"
+        print(detalle)
+
+    lotes = resumir_lotes([latencia for metricas in metricas_archivos.values() for latencia in metricas["lotes"]])
+    if lotes:
+        print(f"Latencia de los lotes ({lotes['lotes']}): p50 {lotes['p50_ms']:.1f} ms / p90 {lotes['p90_ms']:.1f} ms / "
+              f"p99 {lotes['p99_ms']:.1f} ms / máx. {lotes['max_ms']:.1f} ms")
+
+def guardar_reporte(carpeta, inicio, segundos_totales):
+    # Guardar el reporte JSON de la ejecución con las métricas por archivo y los totales por etapa
+    ruta_reporte = RUTA_REPORTE or os.path.join(carpeta, f"reporte_{SCRIPT}_{inicio.strftime('%Y%m%d_%H%M%S')}.json")
+    archivos = {}
+    for archivo, metricas in sorted(metricas_archivos.items()):
+        archivos[archivo] = {clave: valor for clave, valor in metricas.items() if clave != "lotes"}
+        archivos[archivo]["lotes"] = resumir_lotes(metricas["lotes"])
+    reporte = {
+        "script": f"{SCRIPT}.py",
+        "inicio": inicio.isoformat(timespec="seconds"),
+        "segundos": segundos_totales,
+        "memoria_pico_mb": memoria_pico_mb(),
+        "opciones": {
+            "STREAMING": STREAMING, "TAMANO_BLOQUE": TAMANO_BLOQUE, "WORKERS": WORKERS, "MANIFIESTO": MANIFIESTO,
+            "MOTOR_CARGA": MOTOR_CARGA, "INFERIR_TIPOS": INFERIR_TIPOS, "CLAVES_DUPLICADAS": CLAVES_DUPLICADAS,
+            "COMPACTAR": COMPACTAR,
+        },
+        "etapas": totalizar_etapas(),
+        "indices": indices_creados,
+        "particiones": filas_particiones,
+        "memoria_tablas": memoria_tablas,
+        "lotes": resumir_lotes([latencia for metricas in metricas_archivos.values() for latencia in metricas["lotes"]]),
+        "archivos": archivos,
+    }
+    with open(ruta_reporte, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"\nReporte de la ejecución guardado en: {ruta_reporte}")
+
 def procesar_y_cargar_archivos(carpeta):
+    inicio_proceso = datetime.now()
+    inicio = time.perf_counter()
     archivos_cargados = []
     archivos_sin_id_persona = []
+    archivos_omitidos = []
+    evitado = {"bytes": 0, "filas": 0}
     archivos_con_errores = []
 
-    for archivo in os.listdir(carpeta):
-        # Utilizar expresiones regulares para identificar el patrón en el nombre del archivo
-        match_cruce = re.match(r"CRUCE_\d+_(.+)\.TXT", archivo)
-        match_b = re.match(r"B002537_\d+\.TXT", archivo)
-
-        if match_cruce:
-            # Construir la clave sin el número para archivos CRUCE_
-            clave = f"CRUCE_{match_cruce.group(1)}"
-            if clave in archivo_a_tabla:
-                ruta_archivo = os.path.join(carpeta, archivo)
-                print(f"\nPROCESANDO ARCHIVO: {archivo}")
-                if procesar_archivo(archivo, ruta_archivo, archivo_a_tabla[clave], archivos_sin_id_persona, archivos_con_errores):
-                    archivos_cargados.append(archivo)
-                else:
-                    archivos_con_errores.append(archivo)
-        elif match_b:
-            # Clave fija para archivos B002537_
-            clave = "B002537_"
-            if clave in archivo_a_tabla:
-                ruta_archivo = os.path.join(carpeta, archivo)
-                print(f"PROCESANDO ARCHIVO: {archivo}")
-                if procesar_archivo(archivo, ruta_archivo, archivo_a_tabla[clave], archivos_sin_id_persona, archivos_con_errores):
-                    archivos_cargados.append(archivo)
-                else:
-                    archivos_con_errores.append(archivo)
+    # Agrupar los archivos por tabla: los de una misma tabla se procesan en orden y en el mismo worker,
+    # mientras que las distintas tablas se procesan en paralelo (WORKERS), empezando por las más grandes
+    grupos = {}
+    for archivo in listar_archivos(carpeta):
+        nombre_tabla = obtener_tabla(archivo)
+        if nombre_tabla:
+            grupos.setdefault(nombre_tabla, []).append(archivo)
+    orden = sorted(grupos, key=lambda tabla: sum(tamano_archivo(os.path.join(carpeta, a)) for a in grupos[tabla]), reverse=True)
+
+    if MANIFIESTO:
+        cargar_manifiesto(carpeta)
+    if CACHE_PARQUET:
+        preparar_cache(carpeta)
+    if CLAVES_DUPLICADAS != "no":
+        preparar_rechazos(carpeta)
+    if REANUDABLE:
+        try:
+            preparar_checkpoints()
+        except SQLAlchemyError as e:
+            # Sin la tabla de checkpoints cada archivo informa el error al leer su checkpoint
+            print(f"No se pudo crear la tabla de checkpoints: {e}")
+
+    # Planes de carga de todas las tablas conocidas, con una sola consulta al esquema de la BD
+    tablas = set(archivo_a_tabla.values())
+    if TABLA_SOMBRA or REANUDABLE:
+        # También las tablas sombra que haya dejado una carga interrumpida
+        tablas |= {nombre_sombra(tabla) for tabla in tablas}
+    try:
+        with medir_etapa("esquema"):
+            cargar_planes(tablas)
+    except SQLAlchemyError as e:
+        # Sin los planes se consulta el esquema de cada tabla al cargarla (y allí se informa el error)
+        print(f"No se pudo consultar el esquema de las tablas: {e}")
+
+    def procesar_grupo(nombre_tabla):
+        resultados_grupo = {}
+        if MANIFIESTO:
+            # Omitir la tabla si sus archivos tienen el mismo contenido que en la última carga
+            with medir_etapa("manifiesto"):
+                firmas = firmar_archivos(carpeta, grupos[nombre_tabla], nombre_tabla)
+            if tabla_sin_cambios(nombre_tabla, firmas):
+                print(f"\nTabla '{nombre_tabla.upper()}' sin cambios desde la última carga: se omiten {', '.join(grupos[nombre_tabla])}")
+                with bloqueo_estadisticas:
+                    archivos_omitidos.extend(grupos[nombre_tabla])
+                    evitado["bytes"] += sum(firma["tamano"] for firma in firmas.values())
+                    evitado["filas"] += manifiesto[nombre_tabla].get("filas", 0)
+                return resultados_grupo
+
+        for archivo in grupos[nombre_tabla]:
+            ruta_archivo = os.path.join(carpeta, archivo)
+            print(f"\nPROCESANDO ARCHIVO: {archivo}")
+            contexto_hilo.archivo = archivo
+            inicio_archivo = time.perf_counter()
+            try:
+                resultados_grupo[archivo] = procesar_archivo(archivo, ruta_archivo, nombre_tabla, archivos_sin_id_persona, archivos_con_errores)
+            except Exception as e:
+                # Un error no previsto (por ejemplo de E/S al escribir el archivo limpio) hace fallar solo este
+                # archivo: el resto de la carga sigue y el resumen final lo informa
+                print(f"\nError inesperado al procesar el archivo {archivo}: {e!r}")
+                resultados_grupo[archivo] = False
+            registrar_archivo(archivo, nombre_tabla, ruta_archivo, resultados_grupo[archivo], time.perf_counter() - inicio_archivo)
+            contexto_hilo.archivo = None
+
+        if MANIFIESTO:
+            actualizar_manifiesto(nombre_tabla, firmas, resultados_grupo)
+        return resultados_grupo
+
+    resultados = {}
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for resultados_grupo in pool.map(procesar_grupo, orden):
+            resultados.update(resultados_grupo)
+
+    # Ordenar los resultados por nombre de archivo para que el resumen no dependa del orden de finalización
+    for archivo in sorted(resultados):
+        if resultados[archivo]:
+            archivos_cargados.append(archivo)
+        else:
+            archivos_con_errores.append(archivo)
+
+    # Índices secundarios de las tablas cargadas, una vez que tienen todos sus datos
+    if INDICES:
+        crear_indices({obtener_tabla(archivo) for archivo in archivos_cargados})
+    archivos_sin_id_persona.sort()
+    archivos_omitidos.sort()
+    archivos_con_errores.sort()
 
     # Resumen final del proceso
     print("\nResumen del proceso:")
@@ -94,169 +684,1611 @@ def procesar_y_cargar_archivos(carpeta):
     for archivo in archivos_con_errores:
         print(f" - {archivo}")
 
-def procesar_archivo(archivo, ruta_archivo, nombre_tabla, archivos_sin_id_persona, archivos_con_errores):
-    # Intentar leer el archivo con diferentes codificaciones conocidas
-    for encoding in CODIFICACIONES_CONOCIDAS:
+    # Filas con la clave repetida o inválida en cada archivo
+    if CLAVES_DUPLICADAS != "no":
+        imprimir_claves()
+
+    # Archivos omitidos por el manifiesto y trabajo evitado
+    if MANIFIESTO:
+        print(f"\nArchivos omitidos por no tener cambios ({len(archivos_omitidos)}):")
+        for archivo in archivos_omitidos:
+            print(f" - {archivo}")
+        print(f"Evitado: {evitado['bytes']} bytes / {evitado['filas']} filas")
+
+    # Rendimiento de cada motor de carga utilizado
+    if rendimiento_motores:
+        print("\nRendimiento por motor de carga:")
+        for motor, datos in sorted(rendimiento_motores.items()):
+            filas_por_segundo = datos["filas"] / datos["segundos"] if datos["segundos"] else 0
+            print(f" - {motor}: {datos['filas']} filas en {datos['segundos']:.1f} s ({filas_por_segundo:.0f} filas/s)")
+
+    if memoria_tablas:
+        imprimir_memoria()
+
+    if filas_particiones:
+        imprimir_particiones()
+
+    if indices_creados:
+        imprimir_indices()
+
+    # Tiempo, filas y memoria por etapa, y reporte JSON de la ejecución
+    segundos_totales = time.perf_counter() - inicio
+    imprimir_metricas(segundos_totales)
+    if REPORTE:
+        guardar_reporte(carpeta, inicio_proceso, segundos_totales)
+
+def columnas_a_indexar(connection, nombre_tabla):
+    # Columnas de indices_por_tabla (e id_persona) que están en la tabla, no son su clave primaria ni ya encabezan un índice
+    plan = obtener_plan(nombre_tabla)
+    if plan is None:
+        return []
+    if engine.dialect.name == "mysql":
+        indexadas = {columna.lower() for (columna,) in connection.execute(text("""
+            SELECT COLUMN_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabla AND SEQ_IN_INDEX = 1
+        """), {"tabla": nombre_tabla})}
+    else:
+        indexadas = {indice["column_names"][0].lower() for indice in inspect(connection).get_indexes(nombre_tabla)}
+    columnas = dict.fromkeys(["id_persona"] + indices_por_tabla.get(nombre_tabla, []))
+    return [columna for columna in columnas if columna in plan["tipos"] and columna != plan["pk"] and columna not in indexadas]
+
+def crear_indices_tabla(nombre_tabla):
+    """
+    Crea los índices secundarios que le faltan a una tabla ya cargada. En MySQL se agregan todos con un solo
+    ALTER TABLE en línea (ALGORITHM=INPLACE, LOCK=NONE): la tabla sigue disponible para consultas y escrituras
+    mientras se construyen. Devuelve las columnas indexadas y el tamaño de los índices secundarios de la tabla
+    en bytes (None si el motor no lo informa).
+    """
+    with engine.connect() as connection:
+        columnas = columnas_a_indexar(connection, nombre_tabla)
+        if engine.dialect.name == "mysql":
+            if columnas:
+                indices = ", ".join(f"ADD INDEX idx_{columna} ({columna})" for columna in columnas)
+                connection.execute(text(f"ALTER TABLE {nombre_tabla} {indices}, ALGORITHM=INPLACE, LOCK=NONE"))
+        else:
+            for columna in columnas:
+                connection.execute(text(f"CREATE INDEX idx_{nombre_tabla}_{columna} ON {nombre_tabla} ({columna})"))
+        connection.commit()
+
+        tamano = None
+        if engine.dialect.name == "mysql":
+            # ANALYZE actualiza las estadísticas que information_schema.TABLES guarda en caché
+            connection.execute(text(f"ANALYZE TABLE {nombre_tabla}")).fetchall()
+            tamano = connection.execute(text("""
+                SELECT INDEX_LENGTH FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabla
+            """), {"tabla": nombre_tabla}).scalar()
+    return columnas, tamano
+
+def crear_indices(tablas):
+    # Crear los índices secundarios de las tablas cargadas, varias tablas en paralelo y cada una con su conexión
+    def crear(nombre_tabla):
+        inicio = time.perf_counter()
         try:
-            with open(ruta_archivo, 'r', encoding=encoding) as f:
-                lines = f.read().splitlines()
-            print(f"Codificación detectada: {encoding}")
-            break
-        except (UnicodeDecodeError, ValueError):
+            with medir_etapa("indices_secundarios"):
+                columnas, tamano = crear_indices_tabla(nombre_tabla)
+            resultado = {"columnas": columnas, "segundos": time.perf_counter() - inicio, "tamano_bytes": tamano}
+        except SQLAlchemyError as e:
+            print(f"Error al crear los índices de la tabla '{nombre_tabla.upper()}': {e}")
+            resultado = {"columnas": [], "segundos": time.perf_counter() - inicio, "tamano_bytes": None, "error": str(e)}
+        with bloqueo_estadisticas:
+            indices_creados[nombre_tabla] = resultado
+
+    print(f"\nCreando índices secundarios de {len(tablas)} tablas...")
+    with ThreadPoolExecutor(max_workers=WORKERS_INDICES) as pool:
+        list(pool.map(crear, sorted(tablas)))
+
+def imprimir_indices():
+    # Tiempo de construcción y tamaño de los índices secundarios de cada tabla
+    print(f"\nÍndices secundarios ({len(indices_creados)} tablas):")
+    for tabla, datos in sorted(indices_creados.items()):
+        if "error" in datos:
+            detalle = "error al crearlos"
+        elif datos["columnas"]:
+            detalle = f"{', '.join(datos['columnas'])} en {datos['segundos']:.1f} s"
+        else:
+            detalle = "sin índices nuevos"
+        if datos["tamano_bytes"] is not None:
+            detalle += f" (índices secundarios: {datos['tamano_bytes'] / (1024 * 1024):.1f} MB)"
+        print(f" - {tabla}: {detalle}")
+
+def imprimir_memoria():
+    # Memoria de los datos de cada tabla (todos sus archivos) antes y después de compactarlos
+    print("\nMemoria de los datos por tabla (COMPACTAR=1):")
+    for tabla, memoria in sorted(memoria_tablas.items()):
+        ahorro = 100 * (1 - memoria["despues"] / memoria["antes"]) if memoria["antes"] else 0
+        print(f" - {tabla}: {memoria['antes'] / (1024 * 1024):.1f} MB -> {memoria['despues'] / (1024 * 1024):.1f} MB ({ahorro:.0f}% menos)")
+
+def imprimir_particiones():
+    # Filas cargadas en cada partición (p0, p1, ... son los nombres que MySQL da a las particiones)
+    print("\nFilas por partición:")
+    for tabla, filas in sorted(filas_particiones.items()):
+        detalle = ", ".join(f"p{numero} {cantidad}" for numero, cantidad in enumerate(filas))
+        print(f" - {tabla} ({len(filas)} particiones): {detalle}")
+
+def preparar_rechazos(carpeta):
+    # Carpeta donde depurar_claves escribe las filas apartadas de cada archivo
+    global carpeta_rechazos
+    carpeta_rechazos = RUTA_RECHAZOS or carpeta
+    os.makedirs(carpeta_rechazos, exist_ok=True)
+
+def imprimir_claves():
+    # Filas con la clave repetida o inválida de cada archivo y dónde quedaron las apartadas
+    print(f"\nClaves repetidas o inválidas (CLAVES_DUPLICADAS={CLAVES_DUPLICADAS}):")
+    for archivo, metricas in sorted(metricas_archivos.items()):
+        conteo = metricas.get("claves")
+        if conteo is None:
             continue
+        detalle = f" - {archivo}: {conteo['duplicadas']} filas con la clave repetida, {conteo['invalidas']} con la clave vacía o no numérica"
+        if conteo["apartadas"]:
+            detalle += f" ({conteo['apartadas']} filas apartadas en {conteo['rechazos']})"
+        print(detalle)
+
+def preparar_cache(carpeta):
+    # Crear la carpeta de la caché Parquet y leer su índice; sin pyarrow se sigue sin caché
+    global carpeta_cache, indice_cache
+    if pq is None:
+        print("CACHE_PARQUET=1 requiere pyarrow (pip install pyarrow): se continúa sin caché.")
+        return
+    carpeta_cache = RUTA_CACHE or os.path.join(carpeta, "cache_limpio")
+    os.makedirs(carpeta_cache, exist_ok=True)
+    ruta_indice = os.path.join(carpeta_cache, "indice.json")
+    if os.path.exists(ruta_indice):
+        with open(ruta_indice, 'r', encoding='utf-8') as f:
+            indice_cache = json.load(f)
     else:
+        indice_cache = {}
+
+def obtener_ruta_cache(archivo, ruta_archivo):
+    # Ruta del archivo Parquet de la caché: nombre del archivo más el comienzo del hash de su contenido
+    with medir_etapa("cache"):
+        firma = firma_archivo(ruta_archivo, indice_cache.get(archivo))
+    with bloqueo_estadisticas:
+        if indice_cache.get(archivo) != firma:
+            indice_cache[archivo] = firma
+            # Igual que el manifiesto, el índice se escribe primero en un archivo temporal
+            ruta_indice = os.path.join(carpeta_cache, "indice.json")
+            with open(ruta_indice + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(indice_cache, f, indent=2, ensure_ascii=False)
+            os.replace(ruta_indice + ".tmp", ruta_indice)
+    return os.path.join(carpeta_cache, f"{archivo}.{firma['hash'][:16]}.parquet")
+
+def tabla_cache(df):
+    # Tabla Arrow de un bloque limpio: todas las columnas como texto, igual que en el archivo
+    esquema = pa.schema([(columna, pa.string()) for columna in df.columns])
+    return pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+
+def publicar_cache(temporal, ruta_cache, archivo):
+    # Reemplazar la caché anterior del archivo (de otro contenido) por la recién escrita
+    prefijo = f"{archivo}."
+    for nombre in os.listdir(carpeta_cache):
+        if nombre.startswith(prefijo) and nombre.endswith(".parquet") and os.path.join(carpeta_cache, nombre) != ruta_cache:
+            os.remove(os.path.join(carpeta_cache, nombre))
+    os.replace(temporal, ruta_cache)
+
+def guardar_cache(df, ruta_cache, archivo):
+    # Guardar en la caché el DataFrame limpio de un archivo completo; si falla, la carga sigue sin caché
+    temporal = ruta_cache + ".tmp"
+    try:
+        with medir_etapa("cache") as medicion:
+            pq.write_table(tabla_cache(df), temporal)
+            publicar_cache(temporal, ruta_cache, archivo)
+            medicion["filas"] = len(df)
+    except (OSError, pa.ArrowException) as e:
+        print(f"No se pudo guardar la caché de {archivo}: {e}")
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+def escribir_cache(bloques, ruta_cache, archivo):
+    """
+    Variante de guardar_cache para STREAMING=1: guarda en la caché cada bloque limpio a medida que pasa hacia la
+    carga. La caché se publica solo si se recorrieron todos los bloques; si falla la escritura se sigue sin caché.
+    """
+    temporal = ruta_cache + ".tmp"
+    escritor = None
+    guardar = True
+    try:
+        for df in bloques:
+            if guardar:
+                try:
+                    with medir_etapa("cache") as medicion:
+                        tabla = tabla_cache(df)
+                        if escritor is None:
+                            escritor = pq.ParquetWriter(temporal, tabla.schema)
+                        escritor.write_table(tabla)
+                        medicion["filas"] = len(df)
+                except (OSError, pa.ArrowException) as e:
+                    print(f"No se pudo guardar la caché de {archivo}: {e}")
+                    guardar = False
+            yield df
+        if guardar and escritor is not None:
+            escritor.close()
+            escritor = None
+            publicar_cache(temporal, ruta_cache, archivo)
+    finally:
+        if escritor is not None:
+            escritor.close()
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+def leer_cache(ruta_cache):
+    # Bloques de a lo sumo TAMANO_BLOQUE filas leídos de la caché (al menos uno, aunque el archivo no tenga filas)
+    with pq.ParquetFile(ruta_cache) as archivo_parquet:
+        lotes = archivo_parquet.iter_batches(batch_size=TAMANO_BLOQUE)
+        bloques_leidos = 0
+        while True:
+            with medir_etapa("lectura_cache") as medicion:
+                lote = next(lotes, None)
+                if lote is not None:
+                    df = lote.to_pandas()
+                    medicion["filas"] = len(df)
+                    medicion["bytes"] = lote.nbytes
+            if lote is None:
+                break
+            bloques_leidos += 1
+            yield df
+        if bloques_leidos == 0:
+            yield archivo_parquet.schema_arrow.empty_table().to_pandas()
+
+def obtener_ruta_limpio(ruta_archivo):
+    # Ruta del archivo limpio: misma carpeta, con sufijo "_limpio"
+    dir_archivo = os.path.dirname(ruta_archivo)
+    base_archivo = os.path.basename(ruta_archivo)
+    nombre_limpio = re.sub(r'\.TXT$', '_limpio.TXT', base_archivo)
+    if LIMPIO == "gz":
+        nombre_limpio += ".gz"
+    return os.path.join(dir_archivo, nombre_limpio)
+
+def procesar_archivo(archivo, ruta_archivo, nombre_tabla, archivos_sin_id_persona, archivos_con_errores):
+    # Con REANUDABLE=1, filas del archivo ya confirmadas en una ejecución anterior
+    checkpoint = None
+    if REANUDABLE:
+        try:
+            checkpoint = leer_checkpoint(archivo, ruta_archivo, nombre_tabla)
+        except SQLAlchemyError as e:
+            print(f"Error al leer el checkpoint de {archivo}: {e}")
+            archivos_con_errores.append(archivo)
+            return False
+
+    # Si los datos limpios del archivo ya están en la caché Parquet se cargan desde allí
+    ruta_cache = obtener_ruta_cache(archivo, ruta_archivo) if carpeta_cache else None
+    if ruta_cache and os.path.exists(ruta_cache):
+        cargado = procesar_desde_cache(archivo, ruta_cache, nombre_tabla, archivos_sin_id_persona, checkpoint)
+        if cargado is not None:
+            if not cargado:
+                archivos_con_errores.append(archivo)
+            return cargado
+
+    if STREAMING:
+        return procesar_archivo_por_bloques(archivo, ruta_archivo, nombre_tabla, archivos_sin_id_persona, archivos_con_errores, ruta_cache, checkpoint)
+
+    # Decidir la codificación a partir de una muestra y leer el archivo una sola vez
+    encoding = detectar_codificacion(ruta_archivo, nombre_tabla)
+    header, partes = None, None
+    if encoding is not None:
+        try:
+            header, textos = separar_encabezado(leer_textos(ruta_archivo, encoding, nombre_tabla))
+            partes = [] if header is None else [parsear_texto(texto, len(header)) for texto in textos]
+        except UnicodeDecodeError:
+            pass
+    if partes is None:
         print(f"\nError: El archivo {archivo} está codificado con una codificación no conocida.")
         archivos_con_errores.append(archivo)
         return False
 
-    if not lines:
+    if header is None:
         print(f"\nEl archivo {archivo} está vacío.")
         archivos_con_errores.append(archivo)
         return False
 
-    # Leer el encabezado y determinar la cantidad de columnas
-    header_line = lines[0].strip()
-    header = header_line.split("\t")
-
-    # Función para ajustar cada fila: si tiene más columnas se recorta, si tiene menos se rellena
-    def ajustar_fila(row_list):
-        if len(row_list) > len(header):
-            return row_list[:len(header)]
-        elif len(row_list) < len(header):
-            return row_list + [''] * (len(header) - len(row_list))
+    df = partes[0] if len(partes) == 1 else pd.concat(partes, ignore_index=True)
+
+    # Guardar el archivo limpio en la misma carpeta, con sufijo "_limpio"
+    # Normalizar nombres de columnas (quitar espacios y pasar a minúsculas) y quitar los espacios de los valores
+    normalizado = armar_bloque(df, header)
+
+    # Guardar el archivo limpio en la misma carpeta, con sufijo "_limpio"; si se va a cargar con LOAD DATA se
+    # escriben los valores ya recortados (ver generar_bloques)
+    ruta_limpio = obtener_ruta_limpio(ruta_archivo)
+    with abrir_limpio(ruta_limpio, header) as f_limpio:
+        escribir_limpio(f_limpio, normalizado if usar_load_data() else df)
+    if LIMPIO != "no":
+        print(f"Archivo limpio guardado en: {ruta_limpio}")
+    df = normalizado
+    if ruta_cache:
+        guardar_cache(df, ruta_cache, archivo)
+    if COMPACTAR:
+        df = compactar_bloque(df, nombre_tabla)
+    print("Columnas en el DataFrame:", df.columns)
+    print("Número total de filas leídas:", len(df))
+    filas_leidas[archivo] = len(df)
+
+    # Verificar la presencia de la columna 'id_persona'
+    if 'id_persona' not in df.columns:
+        print(f"El archivo no contiene la columna 'ID_PERSONA'.")
+        archivos_sin_id_persona.append(archivo)
+
+    # Cargar los datos en la base de datos (DROP + CREATE)
+    if not cargar_datos_en_bd(df, nombre_tabla, ruta_limpio=ruta_limpio, checkpoint=checkpoint):
+        archivos_con_errores.append(archivo)
+        return False
+
+    return True
+
+def procesar_desde_cache(archivo, ruta_cache, nombre_tabla, archivos_sin_id_persona, checkpoint=None):
+    """
+    Carga un archivo desde su caché Parquet: los datos ya están limpios, así que no se detecta la codificación,
+    no se parsea ni se quitan espacios. Con STREAMING=1 la caché se lee y se carga por bloques de TAMANO_BLOQUE
+    filas. No se usa LOAD DATA, ya que el archivo limpio no se vuelve a escribir. Devuelve None si la caché no
+    se puede leer, para que el archivo se cargue desde el .txt.
+    """
+    try:
+        metadatos = pq.read_metadata(ruta_cache)
+        if not STREAMING:
+            with medir_etapa("lectura_cache") as medicion:
+                tabla = pq.read_table(ruta_cache)
+                df = tabla.to_pandas()
+                medicion["filas"] = len(df)
+                medicion["bytes"] = tabla.nbytes
+    except (OSError, pa.ArrowException) as e:
+        # Una caché truncada o dañada no hace fallar el archivo: se vuelve a leer el .txt, que la reemplaza
+        print(f"No se pudo leer la caché de {archivo}, se lee el archivo original: {e}")
+        return None
+    print(f"Datos limpios leídos de la caché: {ruta_cache}")
+    columnas = pd.Index(metadatos.schema.names)
+    print("Columnas en el DataFrame:", columnas)
+    print("Número total de filas leídas:", metadatos.num_rows)
+    filas_leidas[archivo] = metadatos.num_rows
+
+    # Verificar la presencia de la columna 'id_persona'
+    if 'id_persona' not in columnas:
+        print(f"El archivo no contiene la columna 'ID_PERSONA'.")
+        archivos_sin_id_persona.append(archivo)
+
+    if STREAMING:
+        return cargar_datos_en_bd(leer_cache(ruta_cache), nombre_tabla, checkpoint=checkpoint)
+    if COMPACTAR:
+        df = compactar_bloque(df, nombre_tabla)
+    return cargar_datos_en_bd(df, nombre_tabla, checkpoint=checkpoint)
+
+def detectar_codificacion(ruta_archivo, nombre_tabla):
+    """
+    Decide la codificación del archivo decodificando solo sus primeros MUESTRA_CODIFICACION bytes con cada
+    codificación conocida. La decisión se guarda por tabla y se reutiliza para los siguientes archivos de la
+    misma tabla; si más adelante un byte la contradice, leer_textos cambia de codificación sin volver a empezar.
+    """
+    with medir_etapa("codificacion") as medicion:
+        if nombre_tabla in codificaciones_por_tabla:
+            encoding = codificaciones_por_tabla[nombre_tabla]
+            print(f"Codificación detectada: {encoding} (reutilizada de la tabla '{nombre_tabla}', 0 bytes inspeccionados)")
+            return encoding
+
+        with abrir_archivo(ruta_archivo) as f:
+            muestra = f.read(MUESTRA_CODIFICACION)
+        medicion["bytes"] = len(muestra)
+        # Si la muestra no cubre todo el archivo, un carácter multibyte cortado al final no es un error
+        final = len(muestra) < MUESTRA_CODIFICACION
+
+        for encoding in CODIFICACIONES_CONOCIDAS:
+            try:
+                codecs.getincrementaldecoder(encoding)().decode(muestra, final=final)
+            except UnicodeDecodeError:
+                continue
+            codificaciones_por_tabla[nombre_tabla] = encoding
+            print(f"Codificación detectada: {encoding} ({len(muestra)} bytes inspeccionados)")
+            return encoding
+        return None
+
+def decodificar_bloque(datos, encoding):
+    # Decodificar un bloque con la codificación actual o, si falla, con la siguiente codificación conocida que lo acepte
+    try:
+        return datos.decode(encoding), encoding
+    except UnicodeDecodeError:
+        for alternativa in CODIFICACIONES_CONOCIDAS:
+            if alternativa == encoding:
+                continue
+            try:
+                return datos.decode(alternativa), alternativa
+            except UnicodeDecodeError:
+                continue
+        raise
+
+def bloques_de_lineas(f, tamano_lectura, restante=None):
+    """
+    Genera los bytes de un archivo abierto en modo binario en bloques de líneas completas, cortados en un salto de
+    línea (\n, o \r en archivos con fin de línea \r). Con `restante` se leen a lo sumo esa cantidad de bytes.
+    """
+    partes = []
+    while True:
+        datos = f.read(tamano_lectura if restante is None else min(tamano_lectura, restante))
+        if restante is not None:
+            restante -= len(datos)
+        if datos:
+            # Un \r al final de lo leído no corta el bloque: el \n de un \r\n puede llegar en la próxima lectura
+            corte = max(datos.rfind(b"\n"), datos.rfind(b"\r", 0, len(datos) - 1)) + 1
+            if corte == 0:
+                # Sin salto de línea todavía: lo leído se junta recién al encontrarlo, sin copiarlo en cada lectura
+                partes.append(datos)
+                continue
+            partes.append(datos[:corte])
+            datos, partes = b"".join(partes), [datos[corte:]]
         else:
-            return row_list
+            datos, partes = b"".join(partes), []
+            if not datos:
+                return
+        yield datos
+
+def leer_textos(ruta_archivo, encoding, nombre_tabla, tamano_lectura=1024 * 1024):
+    """
+    Lee el archivo en modo binario, en bloques de líneas completas (ver bloques_de_lineas), y genera cada bloque
+    ya decodificado. Si un bloque no es válido en la codificación elegida se continúa con otra codificación
+    conocida desde ese bloque, sin releer lo ya procesado.
+    """
+    with abrir_archivo(ruta_archivo) as f:
+        inicio = time.perf_counter()
+        for datos in bloques_de_lineas(f, tamano_lectura):
+            texto, nueva = decodificar_bloque(datos, encoding)
+            if nueva != encoding:
+                print(f"Aviso: el archivo no es válido en {encoding} a partir de un bloque intermedio; se continúa con {nueva}.")
+                encoding = nueva
+                codificaciones_por_tabla[nombre_tabla] = nueva
+            registrar_etapa("lectura", time.perf_counter() - inicio, bytes_procesados=len(datos))
+            yield texto
+            inicio = time.perf_counter()
+
+def separar_encabezado(textos):
+    """
+    Separa la primera línea del primer bloque de texto. Devuelve las columnas del encabezado y un iterador con
+    el resto de los bloques, o (None, None) si el archivo está vacío.
+    """
+    for texto in textos:
+        fin = re.match(f"[^\r\n{OTROS_FINES_DE_LINEA}]*(?:\r\n|[\r\n{OTROS_FINES_DE_LINEA}])?", texto).end()
+        return texto[:fin].strip().split("\t"), itertools.chain([texto[fin:]], textos)
+    return None, None
 
-    # Procesar las filas (sin incluir el encabezado)
-    rows = []
-    for line in lines:
-        if line.strip() == "":
-            rows.append([''] * len(header))
+def parsear_texto(texto, ancho):
+    """
+    Convierte líneas separadas por tabulaciones en un DataFrame de `ancho` columnas con el lector en C de pandas,
+    sin comillas ni valores nulos: las filas más largas se recortan y las más cortas o vacías se completan con ''.
+    Los valores quedan sin recortar, como se escriben en el archivo limpio. Las líneas se separan igual que con
+    str.splitlines (ver OTROS_FINES_DE_LINEA); un bloque con bytes NUL, que el lector en C toma como fin del valor,
+    se separa en Python.
+    """
+    with medir_etapa("parseo") as medicion:
+        if "\x00" in texto:
+            filas = [(linea.split("\t") if linea.strip() else []) + [""] * ancho for linea in texto.splitlines()]
+            df = pd.DataFrame([fila[:ancho] for fila in filas], columns=range(ancho), dtype=object)
         else:
-            row = line.split("\t")
-            row = ajustar_fila(row)
-            rows.append(row)
+            if any(fin in texto for fin in OTROS_FINES_DE_LINEA):
+                texto = re.sub(f"[{OTROS_FINES_DE_LINEA}]", "\n", texto)
+            # Las líneas con solo espacios se vacían, para que queden como filas vacías igual que las líneas en blanco
+            texto = re.sub(r"^[^\S\r\n]+(?=[\r\n]|\Z)", "", texto, flags=re.M)
+            # Una primera línea con el ancho completo evita el error de pandas cuando ninguna fila del bloque llega a ese ancho
+            guia = "\t" * (ancho - 1) + "\n"
+            df = pd.read_csv(io.StringIO(guia + texto), sep="\t", header=None, names=range(ancho), usecols=range(ancho),
+                             dtype=str, na_filter=False, quoting=csv.QUOTE_NONE, skip_blank_lines=False, engine="c")
+            df = df.iloc[1:].reset_index(drop=True)
+        medicion["filas"] = len(df)
+    return df
 
-    # Crear la tabla PETL a partir de las filas procesadas
-    tabla = etl.wrap(rows).setheader(header)
+@contextmanager
+def abrir_limpio(ruta_limpio, header):
+    # Abrir el archivo limpio según LIMPIO y escribir el encabezado; con LIMPIO=no se devuelve None
+    if LIMPIO == "no":
+        yield None
+        return
+    if LIMPIO == "gz":
+        # Nivel 1: el más rápido; el texto limpio igual se comprime bien
+        f_limpio = gzip.open(ruta_limpio, 'wt', encoding='utf-8', newline='', compresslevel=1)
+    else:
+        f_limpio = open(ruta_limpio, 'w', encoding='utf-8', newline='')
+    with f_limpio:
+        csv.writer(f_limpio, delimiter="\t").writerow(header)
+        yield f_limpio
 
-    # Guardar el archivo limpio en la misma carpeta, con sufijo "_limpio"
-    dir_archivo = os.path.dirname(ruta_archivo)
-    base_archivo = os.path.basename(ruta_archivo)
-    nombre_limpio = re.sub(r'\.TXT$', '_limpio.TXT', base_archivo)
-    ruta_limpio = os.path.join(dir_archivo, nombre_limpio)
-    etl.tocsv(tabla, ruta_limpio, delimiter="\t", encoding='utf-8')
-    print(f"Archivo limpio guardado en: {ruta_limpio}")
+def escribir_limpio(f_limpio, df):
+    # Agregar las filas al archivo limpio con el mismo formato que csv.writer (tabulaciones y fin de línea \r\n)
+    if f_limpio is None:
+        return
+    with medir_etapa("archivo_limpio") as medicion:
+        df.to_csv(f_limpio, sep="\t", header=False, index=False, lineterminator="\r\n")
+        medicion["filas"] = len(df)
 
-    # Convertir la tabla limpia a un DataFrame de pandas
-    df = etl.todataframe(tabla)
+def armar_bloque(df, header):
+    # Nombrar las columnas de un bloque ya parseado con el encabezado normalizado y quitar los espacios de los valores
+    with medir_etapa("normalizacion") as medicion:
+        bloque = pd.DataFrame({posicion: df[posicion].str.strip() for posicion in df.columns})
+        bloque.columns = pd.Index(header).str.strip().str.lower()
+        medicion["filas"] = len(bloque)
+    return bloque
 
-    # Normalizar nombres de columnas: quitar espacios y pasar a minúsculas
-    df.columns = df.columns.str.strip().str.lower()
-    print("Columnas en el DataFrame:", df.columns)
-    print("Número total de filas leídas:", len(df))
+def compactar_bloque(df, nombre_tabla):
+    """
+    Representación compacta de un DataFrame ya normalizado (COMPACTAR=1); las columnas que no cambian no se copian.
+    La clave de elegir_pk, si es entera y todos sus valores son números enteros, pasa a int64 (como la
+    dejaría la conversión), y cada columna de texto con a lo sumo PROPORCION_CATEGORIAS de valores distintos pasa
+    a categórica. La memoria de los datos antes y después se acumula por tabla.
+    """
+    with medir_etapa("compactacion") as medicion:
+        antes = int(df.memory_usage(deep=True).sum())
+        clave = elegir_pk(df.columns, nombre_tabla)
+        for columna in df.columns:
+            serie = df[columna]
+            if serie.dtype != object or serie.empty:
+                continue
+            if columna == clave:
+                if clave_entera(nombre_tabla, clave):
+                    numeros = pd.to_numeric(serie, errors='coerce')
+                    # Con un valor vacío o no entero queda float: la clave se deja como texto para la conversión
+                    if numeros.dtype == np.int64:
+                        df[columna] = numeros
+                continue
+            muestra = serie.iloc[:MUESTRA_CATEGORIAS]
+            if muestra.nunique() <= len(muestra) * PROPORCION_CATEGORIAS:
+                categorica = serie.astype("category")
+                if len(categorica.cat.categories) <= len(serie) * PROPORCION_CATEGORIAS:
+                    df[columna] = categorica
+        despues = int(df.memory_usage(deep=True).sum())
+        medicion["filas"] = len(df)
+    with bloqueo_estadisticas:
+        memoria = memoria_tablas.setdefault(nombre_tabla, {"antes": 0, "despues": 0})
+        memoria["antes"] += antes
+        memoria["despues"] += despues
+    return df
+
+def generar_bloques(textos, header, f_limpio, contador, tamano_bloque=TAMANO_BLOQUE, recortar_limpio=False):
+    """
+    Recorre los bloques de texto (sin el encabezado) y genera DataFrames de a lo sumo tamano_bloque filas,
+    con el mismo ajuste que procesar_archivo. Cada bloque se escribe también en el archivo limpio.
+    Siempre se genera al menos un bloque (vacío si el archivo solo tiene encabezado).
+    Con recortar_limpio (cuando MOTOR_CARGA=load_data carga desde el archivo limpio) se escriben los valores ya
+    recortados con str.strip(), como los envían los otros motores: el TRIM de MySQL solo quita espacios.
+    """
+    resto = parsear_texto("", len(header))
+    bloques_generados = 0
+    for texto in textos:
+        df = parsear_texto(texto, len(header))
+        if len(resto):
+            df = pd.concat([resto, df], ignore_index=True)
+
+        inicio = 0
+        while len(df) - inicio >= tamano_bloque:
+            filas = df.iloc[inicio:inicio + tamano_bloque]
+            bloque = armar_bloque(filas, header)
+            escribir_limpio(f_limpio, bloque if recortar_limpio else filas)
+            contador["filas"] += len(filas)
+            bloques_generados += 1
+            inicio += tamano_bloque
+            yield bloque
+        resto = df.iloc[inicio:]
+
+    if len(resto) or bloques_generados == 0:
+        bloque = armar_bloque(resto, header)
+        escribir_limpio(f_limpio, bloque if recortar_limpio else resto)
+        contador["filas"] += len(resto)
+        yield bloque
+
+def dividir_en_bloques(df, tamano_bloque=TAMANO_BLOQUE):
+    # Bloques de a lo sumo tamano_bloque filas de un DataFrame ya leído (al menos uno, aunque esté vacío)
+    for inicio in range(0, max(len(df), 1), tamano_bloque):
+        yield df.iloc[inicio:inicio + tamano_bloque].copy()
+
+def bloques_en_paralelo(bloques, preparar=None, tabla_lista=None, capacidad=COLA_PIPELINE):
+    """
+    Productor/consumidor de PIPELINE=1: un hilo recorre `bloques` (con STREAMING=1 eso incluye la lectura, el
+    parseo y la escritura del archivo limpio) y aplica `preparar` a cada bloque a partir del segundo, una vez que
+    la tabla está creada (`tabla_lista`), mientras el hilo que carga inserta el bloque anterior.
+    La cola admite a lo sumo `capacidad` bloques: si la BD es más lenta el productor espera en lugar de acumular
+    el archivo en memoria. Un error del productor se vuelve a lanzar en el hilo que carga (que hace rollback) y,
+    si la carga termina antes de recorrer todos los bloques, el productor se detiene.
+    """
+    cola = queue.Queue(maxsize=capacidad)
+    cancelado = threading.Event()
+    archivo = getattr(contexto_hilo, "archivo", None)
+
+    def encolar(tipo, valor):
+        # Esperar lugar en la cola sin quedar bloqueado si la carga ya terminó
+        while not cancelado.is_set():
+            try:
+                cola.put((tipo, valor), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producir():
+        # Las métricas de las etapas del productor se asignan al mismo archivo
+        contexto_hilo.archivo = archivo
+        try:
+            for numero_bloque, df in enumerate(bloques):
+                if preparar and numero_bloque > 0:
+                    while not tabla_lista.wait(0.1):
+                        if cancelado.is_set():
+                            return
+                    df = preparar(df)
+                if not encolar("bloque", df):
+                    return
+            encolar("fin", None)
+        except BaseException as e:
+            encolar("error", e)
+
+    productor = threading.Thread(target=producir, daemon=True)
+    productor.start()
+    try:
+        while True:
+            tipo, valor = cola.get()
+            if tipo == "error":
+                raise valor
+            if tipo == "fin":
+                return
+            yield valor
+    finally:
+        cancelado.set()
+        productor.join()
+
+def procesar_archivo_por_bloques(archivo, ruta_archivo, nombre_tabla, archivos_sin_id_persona, archivos_con_errores, ruta_cache=None, checkpoint=None):
+    """
+    Variante de procesar_archivo para STREAMING=1: el archivo se lee por bloques de texto y se envía a
+    cargar_datos_en_bd en bloques de TAMANO_BLOQUE filas, escribiendo el archivo limpio a medida que avanza.
+    """
+    encoding = detectar_codificacion(ruta_archivo, nombre_tabla)
+    if encoding is None:
+        print(f"\nError: El archivo {archivo} está codificado con una codificación no conocida.")
+        archivos_con_errores.append(archivo)
+        return False
+
+    ruta_limpio = obtener_ruta_limpio(ruta_archivo)
+    contador = {"filas": 0}
+    # Leer el encabezado y determinar la cantidad de columnas
+    header, textos = separar_encabezado(leer_textos(ruta_archivo, encoding, nombre_tabla))
+    if header is None:
+        print(f"\nEl archivo {archivo} está vacío.")
+        archivos_con_errores.append(archivo)
+        return False
+
+    columnas = pd.Index(header).str.strip().str.lower()
+    print("Columnas en el DataFrame:", columnas)
 
     # Verificar la presencia de la columna 'id_persona'
-    if 'id_persona' not in df.columns:
+    if 'id_persona' not in columnas:
         print(f"El archivo no contiene la columna 'ID_PERSONA'.")
         archivos_sin_id_persona.append(archivo)
 
-    # Aplicar strip a columnas de tipo object
-    for col in df.select_dtypes(include='object').columns:
-        df[col] = df[col].str.strip()
+    # Escribir el archivo limpio mientras se cargan los bloques en la base de datos (DROP + CREATE).
+    # Con LOAD DATA primero se escribe el archivo limpio completo y luego se carga desde él.
+    load_data = usar_load_data()
+    perfiles = None
+    with abrir_limpio(ruta_limpio, header) as f_limpio:
+        bloques = generar_bloques(textos, header, f_limpio, contador, recortar_limpio=load_data)
+        if ruta_cache:
+            bloques = escribir_cache(bloques, ruta_cache, archivo)
+        if load_data:
+            # Los bloques solo se recorren para escribir el archivo limpio y, si se infieren los tipos, perfilarlos
+            # (para crear la tabla con los tipos de todo el archivo)
+            for bloque in bloques:
+                if INFERIR_TIPOS:
+                    with medir_etapa("inferencia_tipos") as medicion:
+                        perfiles = perfilar_bloque(bloque, perfiles)
+                        medicion["filas"] = len(bloque)
+        else:
+            cargado = cargar_datos_en_bd(bloques, nombre_tabla, checkpoint=checkpoint)
 
-    # Cargar los datos en la base de datos (DROP + CREATE)
-    if not cargar_datos_en_bd(df, nombre_tabla):
+    if load_data:
+        cargado = cargar_datos_en_bd(armar_bloque(parsear_texto("", len(header)), header), nombre_tabla, ruta_limpio=ruta_limpio, perfiles=perfiles)
+
+    if LIMPIO != "no":
+        print(f"Archivo limpio guardado en: {ruta_limpio}")
+    print("Número total de filas leídas:", contador["filas"])
+    filas_leidas[archivo] = contador["filas"]
+
+    if not cargado:
         archivos_con_errores.append(archivo)
         return False
 
     return True
 
+def perfilar_columna(serie):
+    """
+    Perfil vectorizado de una columna de texto ya recortada: largos observados y, si todos los valores no
+    vacíos son enteros, decimales o fechas, el rango o la precisión que necesitan. Los enteros con ceros a la
+    izquierda se consideran texto para no perderlos. Los perfiles de varios bloques se unen con combinar_perfiles.
+    """
+    # Columnas compactadas (COMPACTAR=1): el perfil solo depende de los valores distintos de una categórica
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = pd.Series(serie.cat.categories, dtype=object)
+    elif serie.dtype != object:
+        serie = serie.astype(str)
+    serie = serie.fillna("")
+    largos = serie.str.len()
+    valores = serie[largos > 0]
+    perfil = {
+        "tipo": "texto",
+        "largo_min": int(largos[largos > 0].min()) if len(valores) else 0,
+        "largo_max": int(largos.max()) if len(largos) else 0
+    }
+    if valores.empty:
+        perfil["tipo"] = "vacio"
+    elif perfil["largo_max"] <= 18 and valores.str.fullmatch(r"-?(?:0|[1-9]\d*)").all():
+        numeros = valores.astype("int64")
+        perfil.update(tipo="entero", minimo=int(numeros.min()), maximo=int(numeros.max()))
+    elif valores.str.fullmatch(r"-?(?:0|[1-9]\d*)\.\d+").all():
+        partes = valores.str.lstrip("-").str.split(".", n=1, expand=True)
+        perfil.update(tipo="decimal", enteros=int(partes[0].str.len().max()), escala=int(partes[1].str.len().max()))
+    elif re.fullmatch(r"\d{1,4}[-/]\d{1,2}[-/]\d{1,4}( \d{1,2}:\d{2}:\d{2})?", valores.iloc[0]):
+        # Solo se prueban los formatos de fecha si el primer valor tiene forma de fecha
+        for tipo, formatos in (("fecha", FORMATOS_FECHA), ("fechahora", FORMATOS_FECHA_HORA)):
+            for formato in formatos:
+                if pd.to_datetime(valores, format=formato, errors="coerce").notna().all():
+                    perfil.update(tipo=tipo, formato=formato)
+                    return perfil
+    return perfil
+
+def digitos_enteros(perfil):
+    if perfil["tipo"] == "entero":
+        return len(str(max(abs(perfil["minimo"]), abs(perfil["maximo"]))))
+    return perfil["enteros"]
+
+def combinar_perfiles(a, b):
+    # Unir los perfiles de una columna en dos bloques con el tipo más angosto que admite ambos
+    if a is None:
+        return b
+    if a["tipo"] == "vacio":
+        return {**b, "largo_max": max(a["largo_max"], b["largo_max"])}
+    if b["tipo"] == "vacio":
+        return {**a, "largo_max": max(a["largo_max"], b["largo_max"])}
+
+    combinado = {
+        "tipo": "texto",
+        "largo_min": min(a["largo_min"], b["largo_min"]),
+        "largo_max": max(a["largo_max"], b["largo_max"])
+    }
+    tipos = {a["tipo"], b["tipo"]}
+    if tipos == {"entero"}:
+        combinado.update(tipo="entero", minimo=min(a["minimo"], b["minimo"]), maximo=max(a["maximo"], b["maximo"]))
+    elif tipos <= {"entero", "decimal"}:
+        combinado.update(tipo="decimal", enteros=max(digitos_enteros(a), digitos_enteros(b)),
+                         escala=max(a.get("escala", 0), b.get("escala", 0)))
+    elif len(tipos) == 1 and a.get("formato") and a.get("formato") == b.get("formato"):
+        combinado.update(tipo=a["tipo"], formato=a["formato"])
+    return combinado
+
+def perfilar_bloque(df, perfiles=None):
+    # Perfil de cada columna del bloque, unido con el de los bloques anteriores si se indica
+    perfiles = dict(perfiles or {})
+    for columna in df.columns:
+        perfiles[columna] = combinar_perfiles(perfiles.get(columna), perfilar_columna(df[columna]))
+    return perfiles
+
+def tipo_desde_perfil(perfil):
+    tipo = perfil["tipo"]
+    if tipo == "entero":
+        if -128 <= perfil["minimo"] and perfil["maximo"] <= 127:
+            return mysql.TINYINT()
+        if -2**31 <= perfil["minimo"] and perfil["maximo"] < 2**31:
+            return mysql.INTEGER()
+        return mysql.BIGINT()
+    if tipo == "decimal" and digitos_enteros(perfil) + perfil["escala"] <= 65 and perfil["escala"] <= 30:
+        return mysql.DECIMAL(digitos_enteros(perfil) + perfil["escala"], perfil["escala"])
+    if tipo == "fecha":
+        return mysql.DATE()
+    if tipo == "fechahora":
+        return mysql.DATETIME()
+    if tipo == "vacio":
+        return String(255)
+
+    largo = max(perfil["largo_max"], 1)
+    if largo > 2000:
+        return mysql.TEXT()
+    if perfil["largo_min"] == largo and largo <= 32:
+        return mysql.CHAR(largo)
+    return mysql.VARCHAR(largo)
+
+def tipo_desde_texto(texto):
+    # Convertir un tipo escrito como en MySQL ("BIGINT", "DECIMAL(12,2)", "VARCHAR(20)") al tipo de SQLAlchemy
+    nombre, argumentos = re.fullmatch(r"\s*(\w+)\s*(?:\((.*)\))?\s*", texto).groups()
+    nombre = {"INT": "INTEGER"}.get(nombre.upper(), nombre.upper())
+    return getattr(mysql, nombre)(*[int(a) for a in argumentos.split(",")] if argumentos else [])
+
+def tipo_columna(nombre_tabla, columna, perfil, es_pk, parcial=False):
+    # Tipo con el que se crea una columna: el de tipos_por_tabla si está definido, sino el inferido. Con `parcial`
+    # (un perfil solo del primer bloque) la clave primaria se crea BIGINT: un bloque posterior puede traer claves
+    # más largas y la clave no se amplía con ALTER TABLE a mitad de la carga
+    forzado = tipos_por_tabla.get(nombre_tabla, {}).get(columna)
+    if forzado:
+        return tipo_desde_texto(forzado)
+    if es_pk:
+        # La clave primaria sigue siendo entera; con 10 o más dígitos puede no entrar en INT
+        return mysql.BIGINT() if parcial or (perfil and perfil["largo_max"] > 9) else Integer
+    if perfil is None:
+        return String(255)
+    return tipo_desde_perfil(perfil)
+
+def ampliar_tipos(connection, df, nombre_tabla, pk, perfiles, tipos, tabla_destino=None):
+    """
+    Con la lectura por bloques, la tabla se crea con los tipos del primer bloque. Si un bloque posterior no
+    entra en esos tipos (un número más grande, un texto más largo o un valor no numérico) se amplía la columna
+    con ALTER TABLE. En MySQL el ALTER confirma implícitamente lo insertado hasta ese momento.
+    `tabla_destino` es la tabla que se modifica si no es `nombre_tabla` (la tabla sombra).
+    """
+    tabla_destino = tabla_destino or nombre_tabla
+    for columna in df.columns:
+        if columna == pk or columna in tipos_por_tabla.get(nombre_tabla, {}):
+            continue
+        perfiles[columna] = combinar_perfiles(perfiles[columna], perfilar_columna(df[columna]))
+        nuevo = tipo_desde_perfil(perfiles[columna])
+        definicion = nuevo.compile(dialect=engine.dialect)
+        if definicion != tipos[columna].compile(dialect=engine.dialect):
+            connection.execute(text(f"ALTER TABLE {tabla_destino} MODIFY {columna} {definicion}"))
+            tipos[columna] = nuevo
+            planes_carga[tabla_destino] = armar_plan(pk, tipos, planes_carga[tabla_destino]["particiones"])
+            print(f"Columna '{columna}' de la tabla '{tabla_destino}' ampliada a {definicion}.")
+
+def convertir_fechas(serie, formatos, formato_salida):
+    # Normalizar fechas escritas en cualquiera de los formatos conocidos; los vacíos o inválidos quedan en NULL (ver
+    # validar_conversion)
+    fechas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    for formato in formatos:
+        fechas = fechas.fillna(pd.to_datetime(serie, format=formato, errors="coerce"))
+    return fechas.dt.strftime(formato_salida).astype(object).where(fechas.notna(), None)
+
+def expresion_load_data(columna, variable, tipo, es_pk):
+    # Expresión del SET de LOAD DATA equivalente a la conversión de convertir_a_formato_tabla para cada tipo; los
+    # valores ya vienen recortados con str.strip() en el archivo limpio (ver generar_bloques), no con TRIM
+    valor = f"NULLIF({variable}, '')"
+    if es_pk:
+        return f"{columna} = CAST({variable} AS SIGNED)"
+    if isinstance(tipo, (sqltypes.Date, sqltypes.DateTime)):
+        formatos = list(FORMATOS_FECHA.values())
+        if isinstance(tipo, sqltypes.DateTime):
+            formatos = list(FORMATOS_FECHA_HORA.values()) + formatos
+        conversiones = ", ".join(f"STR_TO_DATE({valor}, '{formato}')" for formato in formatos)
+        return f"{columna} = COALESCE({conversiones})"
+    if isinstance(tipo, (sqltypes.Integer, sqltypes.Numeric)):
+        return f"{columna} = {valor}"
+    return f"{columna} = {variable}"
+
+def tipo_desde_esquema(tipo_dato, largo, precision, escala):
+    # Tipo de SQLAlchemy de una columna de information_schema.COLUMNS (DATA_TYPE y sus largos)
+    if isinstance(tipo_dato, (bytes, bytearray)):
+        tipo_dato = tipo_dato.decode()
+    if tipo_dato.lower() in ("decimal", "numeric"):
+        return mysql.DECIMAL(precision, escala)
+    try:
+        return tipo_desde_texto(f"{tipo_dato}({largo})" if tipo_dato.lower() in ("char", "varchar") else tipo_dato)
+    except AttributeError:
+        # Tipos que estos scripts no crean (geometrías, etc.): la columna se envía sin convertir
+        return sqltypes.NullType()
+
+def armar_plan(pk, tipos, particiones=0):
+    """
+    Plan de carga de una tabla: la clave primaria, el tipo de cada columna, la conversión que le aplica
+    convertir_a_formato_tabla, la cantidad de particiones por HASH de la clave (0 si no está particionada) y
+    las sentencias ya armadas para esas columnas (ver sentencia_plan).
+    """
+    tipos = {columna: tipo() if isinstance(tipo, type) else tipo for columna, tipo in tipos.items()}
+    conversiones = {}
+    for columna, tipo in tipos.items():
+        if isinstance(tipo, sqltypes.Integer):
+            conversiones[columna] = "clave" if columna == pk else "entero"
+        elif isinstance(tipo, sqltypes.Numeric):
+            conversiones[columna] = "decimal"
+        elif isinstance(tipo, sqltypes.DateTime):
+            conversiones[columna] = "fecha_hora"
+        elif isinstance(tipo, sqltypes.Date):
+            conversiones[columna] = "fecha"
+        elif isinstance(tipo, sqltypes.String):
+            conversiones[columna] = "texto"
+    return {"pk": pk, "tipos": tipos, "conversiones": conversiones, "particiones": particiones,
+            "encabezados": {frozenset(tipos)}, "sentencias": {}}
+
+def cargar_planes(tablas):
+    """
+    Arma los planes de carga de `tablas` con una sola consulta a information_schema.COLUMNS (y otra a PARTITIONS),
+    en lugar de reflejar el esquema de cada tabla (has_table, get_columns, get_pk_constraint) en cada archivo. Las
+    tablas que no existen quedan con plan None. Con otros motores (SQLite en benchmark.py) se usa la reflexión de
+    SQLAlchemy.
+    """
+    tablas = list(tablas)
+    esquemas = {}
+    if engine.dialect.name == "mysql":
+        sql = text("""
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, NUMERIC_PRECISION, NUMERIC_SCALE, COLUMN_KEY
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :tablas
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """).bindparams(bindparam("tablas", expanding=True))
+        with engine.connect() as connection:
+            for tabla, columna, tipo_dato, largo, precision, escala, clave in connection.execute(sql, {"tablas": tablas}):
+                esquema = esquemas.setdefault(tabla.lower(), {"pk": None, "tipos": {}})
+                esquema["tipos"][columna.lower()] = tipo_desde_esquema(tipo_dato, largo, precision, escala)
+                if clave == "PRI":
+                    esquema["pk"] = columna.lower()
+            # Particiones por HASH de la clave primaria (las únicas que se reparten entre workers al cargar)
+            sql = text("""
+                SELECT TABLE_NAME, PARTITION_METHOD, PARTITION_EXPRESSION, COUNT(*)
+                FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :tablas AND PARTITION_NAME IS NOT NULL
+                GROUP BY TABLE_NAME, PARTITION_METHOD, PARTITION_EXPRESSION
+            """).bindparams(bindparam("tablas", expanding=True))
+            for tabla, metodo, expresion, cantidad in connection.execute(sql, {"tablas": tablas}):
+                esquema = esquemas.get(tabla.lower())
+                if esquema and metodo == "HASH" and expresion.strip("`").lower() == esquema["pk"]:
+                    esquema["particiones"] = cantidad
+    else:
+        inspector = inspect(engine)
+        existentes = set(inspector.get_table_names())
+        for tabla in tablas:
+            if tabla in existentes:
+                pk = inspector.get_pk_constraint(tabla)["constrained_columns"]
+                esquemas[tabla] = {"pk": pk[0].lower() if pk else None,
+                                   "tipos": {c["name"].lower(): c["type"] for c in inspector.get_columns(tabla)}}
+    for tabla in tablas:
+        esquema = esquemas.get(tabla)
+        planes_carga[tabla] = armar_plan(esquema["pk"], esquema["tipos"], esquema.get("particiones", 0)) if esquema else None
+
+def obtener_plan(nombre_tabla, columnas=None):
+    """
+    Plan de carga de la tabla, o None si no existe. Si se indican las columnas de un archivo y no coinciden con
+    las del plan, el esquema puede haber cambiado desde que se armó y la tabla se vuelve a consultar.
+    """
+    if nombre_tabla not in planes_carga:
+        cargar_planes([nombre_tabla])
+    plan = planes_carga[nombre_tabla]
+    if plan is not None and columnas is not None and frozenset(columnas) not in plan["encabezados"]:
+        cargar_planes([nombre_tabla])
+        plan = planes_carga[nombre_tabla]
+        if plan is not None:
+            plan["encabezados"].add(frozenset(columnas))
+    return plan
+
+def sentencia_plan(plan, clave, armar):
+    # Sentencia del plan para `clave` (tipo de sentencia y columnas): se arma la primera vez y luego se reutiliza
+    if clave not in plan["sentencias"]:
+        plan["sentencias"][clave] = armar()
+    return plan["sentencias"][clave]
+
+def validar_conversion(serie, validos, tipo):
+    # Un valor no vacío que no entra en el tipo de la columna no se carga como NULL: el archivo falla con este error
+    invalidos = serie[~validos & serie.notna() & (serie != '')].unique()
+    if len(invalidos):
+        ejemplos = ", ".join(repr(valor) for valor in invalidos[:5])
+        raise ValueError(f"{len(invalidos)} valores distintos de la columna '{serie.name}' no son {tipo} (por ejemplo {ejemplos})")
+
+def convertir_columna(serie, conversion):
+    """
+    Convertir una columna según la conversión de su plan de carga; las que no necesitan cambios se devuelven sin
+    copiar. Los vacíos quedan en NULL y un valor que no entra en el tipo hace fallar el archivo (ver validar_conversion).
+    """
+    if conversion == "entero":
+        # Columnas enteras inferidas
+        numeros = pd.to_numeric(serie, errors='coerce')
+        validar_conversion(serie, (numeros % 1 == 0).to_numpy(), "números enteros")
+        llenos = numeros.notna().to_numpy()
+        if llenos.all():
+            return numeros.astype('Int64').astype(object)
+        # Con vacíos to_numeric pasa por float y pierde precisión en los BIGINT de más de 15 dígitos: los valores se
+        # vuelven a leer sin los vacíos, como en depurar_bloque, y los vacíos quedan en None
+        valores = np.full(len(serie), None, dtype=object)
+        valores[llenos] = pd.to_numeric(serie[llenos]).astype('Int64').to_numpy(dtype=object)
+        return pd.Series(valores, index=serie.index, name=serie.name)
+    if conversion == "clave" and serie.dtype == 'object':
+        return pd.to_numeric(serie, errors='coerce').fillna(0).astype(int)
+    if conversion == "decimal":
+        # Se envía el texto original para no perder precisión; MySQL lo convierte a DECIMAL
+        return serie.where(serie != '', None)
+    if conversion == "fecha_hora":
+        fechas = convertir_fechas(serie, list(FORMATOS_FECHA_HORA) + list(FORMATOS_FECHA), "%Y-%m-%d %H:%M:%S")
+        validar_conversion(serie, fechas.notna().to_numpy(), "fechas")
+        return fechas
+    if conversion == "fecha":
+        fechas = convertir_fechas(serie, list(FORMATOS_FECHA), "%Y-%m-%d")
+        validar_conversion(serie, fechas.notna().to_numpy(), "fechas")
+        return fechas
+    if conversion == "texto":
+        if serie.dtype != 'object' and not isinstance(serie.dtype, pd.CategoricalDtype):
+            return serie.astype(str)
+        # Los valores ya son texto (también los de una categórica): solo los nulos se cambian por None, para que
+        # lleguen como NULL y no como el texto 'nan' que dejaba astype(str)
+        nulos = serie.isna()
+        return serie.astype(object).where(~nulos, None) if nulos.any() else serie
+    return serie
+
+def convertir_categorias(serie, conversion):
+    # Convertir una columna categórica (COMPACTAR=1) convirtiendo solo sus valores distintos y repartiéndolos según
+    # el código de cada fila (el código -1 de un nulo toma el None agregado al final)
+    valores = convertir_columna(pd.Series(serie.cat.categories, dtype=object, name=serie.name), conversion).to_numpy(dtype=object)
+    return pd.Series(np.append(valores, None)[serie.cat.codes.to_numpy()], index=serie.index)
+
 def convertir_a_formato_tabla(df, nombre_tabla):
-    # Obtener el esquema de la tabla desde la BD (cuando ya existe) para ajustar los tipos si es necesario
-    inspector = inspect(engine)
-    columnas_esquema = inspector.get_columns(nombre_tabla)
-    for columna in columnas_esquema:
-        col_name = columna['name'].lower()
-        col_type = columna['type']
+    # Ajustar los tipos según el esquema de la tabla en la BD, tomado de su plan de carga (sin consultarla en cada bloque)
+    plan = obtener_plan(nombre_tabla, df.columns)
+    for col_name, conversion in plan["conversiones"].items():
         if col_name in df.columns:
-            if 'INT' in str(col_type) and df[col_name].dtype == 'object':
-                df[col_name] = pd.to_numeric(df[col_name], errors='coerce').fillna(0).astype(int)
-            elif 'VARCHAR' in str(col_type) or 'TEXT' in str(col_type):
-                df[col_name] = df[col_name].astype(str)
+            serie = df[col_name]
+            if isinstance(serie.dtype, pd.CategoricalDtype) and conversion != "texto":
+                convertida = convertir_categorias(serie, conversion)
+            else:
+                convertida = convertir_columna(serie, conversion)
+            if convertida is not serie:
+                df[col_name] = convertida
     return df
 
-def cargar_datos_en_bd(df, nombre_tabla, lot_size=1000):
+def convertir_bloque(df, nombre_tabla):
+    # Convertir el bloque al formato de la tabla (en el hilo que carga o, con PIPELINE=1, en el productor)
+    df.columns = df.columns.str.lower()
+    with medir_etapa("conversion") as medicion:
+        df = convertir_a_formato_tabla(df, nombre_tabla)
+        medicion["filas"] = len(df)
+    return df
+
+def clave_entera(nombre_tabla, clave):
+    # La clave se crea entera (y convertir_a_formato_tabla deja en 0 un valor vacío o no numérico), salvo que
+    # tipos_por_tabla le indique otro tipo
+    forzado = tipos_por_tabla.get(nombre_tabla, {}).get(clave)
+    return forzado is None or isinstance(tipo_desde_texto(forzado), sqltypes.Integer)
+
+def marcar_claves_vistas(vistas, claves):
+    """
+    Máscara de las claves que ya aparecieron en un bloque anterior del archivo; las del bloque se agregan a
+    `vistas`. Las claves vistas se guardan en niveles ordenados y sin repetir, de tamaño decreciente, y un nivel
+    se une con el anterior cuando lo alcanza, así cada bloque no reordena todas las claves del archivo. Las del
+    bloque se buscan ordenadas (búsqueda binaria que recorre cada nivel en orden) y las uniones concatenan niveles
+    ya ordenados, que el ordenamiento estable (timsort) intercala en tiempo lineal.
+    """
+    orden = np.argsort(claves, kind="stable")
+    ordenadas = claves[orden]
+    vistas_antes = np.zeros(len(claves), dtype=bool)
+    for nivel in vistas:
+        posiciones = np.searchsorted(nivel, ordenadas).clip(max=len(nivel) - 1)
+        vistas_antes[orden[nivel[posiciones] == ordenadas]] = True
+
+    nuevo = ordenadas[np.concatenate(([True], ordenadas[1:] != ordenadas[:-1]))] if len(ordenadas) else ordenadas
+    while len(nuevo) and vistas and len(vistas[-1]) <= len(nuevo):
+        nuevo = np.concatenate([vistas.pop(), nuevo])
+        nuevo.sort(kind="stable")
+        nuevo = nuevo[np.concatenate(([True], nuevo[1:] != nuevo[:-1]))]
+    if len(nuevo):
+        vistas.append(nuevo)
+    return vistas_antes
+
+def depurar_bloque(df, nombre_tabla, vistas, conteo):
+    """
+    Aplica CLAVES_DUPLICADAS a un bloque con las columnas en minúsculas y devuelve las filas a insertar y las
+    apartadas (con la columna "motivo"). La clave es la de elegir_pk; si es entera, un valor que no es un número
+    entero es inválido, y los repetidos se comparan por su valor numérico ("007" y "7" son la misma clave).
+    """
+    clave = elegir_pk(df.columns, nombre_tabla)
+    if clave not in df.columns:
+        return df, df.iloc[:0]
+    claves = df[clave]
+    if clave_entera(nombre_tabla, clave):
+        numeros = pd.to_numeric(claves, errors='coerce')
+        invalidas = (numeros.isna() | (numeros % 1 != 0)).to_numpy()
+        if invalidas.any():
+            # Sin los vacíos las claves se vuelven a leer como enteros, sin perder precisión al pasar por float
+            numeros = pd.to_numeric(claves[~invalidas])
+        valores = numeros.to_numpy().astype(np.int64)
+    else:
+        invalidas = (claves.isna() | (claves == "")).to_numpy()
+        valores = claves[~invalidas].to_numpy()
+
+    # Repetidas en el bloque según la política o ya vistas en un bloque anterior (STREAMING=1): esas claves ya se
+    # insertaron, así que también con "ultimo" se conserva la fila insertada
+    keep = {"primero": "first", "ultimo": "last"}.get(CLAVES_DUPLICADAS, False)
+    duplicadas = pd.Series(valores).duplicated(keep=keep).to_numpy() | marcar_claves_vistas(vistas, valores)
+    conteo["invalidas"] += int(invalidas.sum())
+    conteo["duplicadas"] += int(duplicadas.sum())
+    if not invalidas.any() and not duplicadas.any():
+        return df, df.iloc[:0]
+
+    descartadas = invalidas.copy()
+    descartadas[np.flatnonzero(~invalidas)[duplicadas]] = True
+    apartadas = descartadas if keep is False else invalidas
+    motivos = np.where(invalidas, "clave_invalida", "clave_repetida")[apartadas]
+    # take en lugar de una máscara: el bloque es un DataFrame nuevo que la conversión modifica sin advertencias
+    return df.take(np.flatnonzero(~descartadas)), df[apartadas].assign(motivo=motivos)
+
+def depurar_claves(bloques, nombre_tabla, archivo):
+    """
+    Revisa las claves de los bloques de un archivo antes de convertirlos (ver depurar_bloque) y escribe las filas
+    apartadas en <archivo>_rechazos.TXT, con el formato del archivo limpio y el motivo en la última columna.
+    Los repetidos se buscan en todo el archivo: cada bloque se compara también con las claves de los anteriores.
+    Las cantidades quedan en las métricas del archivo (y en el reporte de la ejecución).
+    """
+    conteo = {"duplicadas": 0, "invalidas": 0, "apartadas": 0, "rechazos": None}
+    with bloqueo_estadisticas:
+        obtener_metricas(archivo or "(general)")["claves"] = conteo
+    ruta_rechazos = None
+    if carpeta_rechazos and archivo:
+        ruta_rechazos = os.path.join(carpeta_rechazos, re.sub(r'\.TXT$', '_rechazos.TXT', archivo))
+        # El archivo de una ejecución anterior se reemplaza (o se elimina si ahora no hay filas apartadas)
+        if os.path.exists(ruta_rechazos):
+            os.remove(ruta_rechazos)
+    vistas = []
+    for df in bloques:
+        with medir_etapa("claves") as medicion:
+            df.columns = df.columns.str.lower()
+            medicion["filas"] = len(df)
+            df, apartadas = depurar_bloque(df, nombre_tabla, vistas, conteo)
+            if len(apartadas) and ruta_rechazos:
+                with open(ruta_rechazos, 'a', encoding='utf-8', newline='') as f:
+                    apartadas.to_csv(f, sep="\t", header=not conteo["apartadas"], index=False, lineterminator="\r\n")
+                conteo["apartadas"] += len(apartadas)
+                conteo["rechazos"] = ruta_rechazos
+        yield df
+
+def particiones_tabla(nombre_tabla, tipo_pk):
+    # Particiones con que se crea la tabla: las de particiones_por_tabla con PARTICIONES=1, en MySQL y si la clave
+    # primaria es entera (PARTITION BY HASH requiere una expresión entera); 0 si no se particiona
+    if not PARTICIONES or engine.dialect.name != "mysql":
+        return 0
+    tipo_pk = tipo_pk() if isinstance(tipo_pk, type) else tipo_pk
+    return particiones_por_tabla.get(nombre_tabla, 0) if isinstance(tipo_pk, sqltypes.Integer) else 0
+
+def crear_tabla(connection, df, nombre_tabla, perfiles=None, sombra=False, parcial=False):
+    """
+    Elimina la tabla si existe y la crea de nuevo. Devuelve la clave primaria, el tipo de cada columna y,
+    con INFERIR_TIPOS=1, los perfiles de columna usados (calculados sobre `df` si no se indican). Con `parcial`
+    `df` es solo el primer bloque del archivo (ver tipo_columna).
+    Con `sombra` se crea en cambio la tabla nombre_sombra(nombre_tabla) sin clave primaria (la agrega
+    publicar_sombra al terminar la carga) y la tabla actual no se toca.
+    """
+    tabla_destino = nombre_sombra(nombre_tabla) if sombra else nombre_tabla
+
+    # Eliminar la tabla si existe (con `sombra`, la que haya quedado de una carga interrumpida)
+    if obtener_plan(tabla_destino) is not None:
+        connection.execute(text(f"DROP TABLE {tabla_destino}"))
+        planes_carga[tabla_destino] = None
+        print(f"Tabla {tabla_destino} eliminada.")
+
+    # Determinar la clave primaria (y unique) según las reglas
+    pk = elegir_pk(df.columns, nombre_tabla)
+
+    # Perfilar las columnas para inferir sus tipos
+    if INFERIR_TIPOS and perfiles is None:
+        perfiles = perfilar_bloque(df)
+
+    # Crear la tabla con la definición de columnas
+    metadata = MetaData()
+    columns = []
+    tipos = {}
+    for name in df.columns:
+        perfil = perfiles.get(name) if perfiles else None
+        tipos[name] = tipo_columna(nombre_tabla, name, perfil, name == pk, parcial) if INFERIR_TIPOS else (Integer if name == pk else String(255))
+        if name == pk and sombra:
+            columns.append(Column(name, tipos[name], nullable=False))
+        elif name == pk:
+            # Se marca como PRIMARY KEY y UNIQUE según lo requerido.
+            columns.append(Column(name, tipos[name], primary_key=True, unique=True))
+        else:
+            columns.append(Column(name, tipos[name]))
+        # Una columna sin valores se crea como VARCHAR(255) y se sigue tratando como texto en los bloques siguientes
+        if perfil and perfil["tipo"] == "vacio":
+            perfiles[name] = {"tipo": "texto", "largo_min": 0, "largo_max": 255}
+    # Con PARTICIONES=1 las tablas grandes se reparten por HASH de la clave (que MySQL exige en toda clave única)
+    particiones = particiones_tabla(nombre_tabla, tipos[pk]) if pk in tipos else 0
+    opciones = {"mysql_partition_by": f"HASH({pk})", "mysql_partitions": str(particiones)} if particiones else {}
+    table = Table(tabla_destino, metadata, *columns, **opciones)
+    # Sin checkfirst: la tabla se acaba de eliminar (o el plan de carga ya indica que no existe)
+    metadata.create_all(engine, checkfirst=False)
+    planes_carga[tabla_destino] = armar_plan(pk, tipos, particiones)
+    print(f"Tabla {tabla_destino} creada.")
+    return pk, tipos, perfiles
+
+def elegir_pk(columnas, nombre_tabla):
+    # Clave primaria según las reglas: en personas_domicilios id_domicilio si está, sino codigo; en las demás
+    # id_persona si está, sino codigo
+    if nombre_tabla == "personas_domicilios":
+        return "id_domicilio" if ("id_domicilio" in columnas or "id_domicilios" in columnas) else "codigo"
+    if "id_persona" in columnas:
+        return "id_persona"
+    return "codigo"
+
+def nombre_sombra(nombre_tabla):
+    # Tabla en la que se carga con TABLA_SOMBRA=1 antes de reemplazar a la definitiva
+    return f"{nombre_tabla}__nueva"
+
+def publicar_sombra(connection, nombre_tabla, pk):
+    """
+    Crea la clave primaria de la tabla sombra ya cargada (un solo ordenamiento en lugar de mantener el índice
+    fila por fila) y la intercambia con la tabla actual con un único RENAME TABLE, que en MySQL es atómico:
+    las consultas ven la tabla anterior completa hasta el intercambio y la nueva completa después.
+    Si la clave no se puede crear (por ejemplo por valores duplicados) o el intercambio falla, la tabla anterior
+    queda intacta, la sombra se descarta y el error se relanza.
+    """
+    sombra = nombre_sombra(nombre_tabla)
+    anterior = f"{nombre_tabla}__anterior"
+    reemplazar = obtener_plan(nombre_tabla) is not None
+
+    try:
+        with medir_etapa("creacion_indices") as medicion:
+            connection.execute(text(f"ALTER TABLE {sombra} ADD PRIMARY KEY ({pk})"))
+            medicion["filas"] = connection.execute(text(f"SELECT COUNT(*) FROM {sombra}")).scalar()
+
+        with medir_etapa("publicacion"):
+            connection.execute(text(f"DROP TABLE IF EXISTS {anterior}"))
+            if reemplazar:
+                connection.execute(text(f"RENAME TABLE {nombre_tabla} TO {anterior}, {sombra} TO {nombre_tabla}"))
+            else:
+                connection.execute(text(f"RENAME TABLE {sombra} TO {nombre_tabla}"))
+            connection.commit()
+    except SQLAlchemyError:
+        descartar_sombra(connection, nombre_tabla)
+        raise
+    # El plan de la sombra pasa a ser el de la tabla (las sentencias armadas llevan el nombre de la sombra)
+    planes_carga[nombre_tabla] = armar_plan(pk, planes_carga[sombra]["tipos"], planes_carga[sombra]["particiones"])
+    planes_carga[sombra] = None
+    print(f"Tabla {sombra} publicada como {nombre_tabla}.")
+
+    if reemplazar:
+        # La tabla nueva ya está publicada: si la anterior no se puede eliminar, se elimina en la próxima publicación
+        try:
+            with medir_etapa("publicacion"):
+                connection.execute(text(f"DROP TABLE {anterior}"))
+                connection.commit()
+        except SQLAlchemyError as e:
+            connection.rollback()
+            print(f"Aviso: no se pudo eliminar la tabla {anterior}: {e}")
+
+def descartar_sombra(connection, nombre_tabla):
+    # Elimina la tabla sombra de una carga fallida; la tabla anterior no se modifica
+    sombra = nombre_sombra(nombre_tabla)
+    try:
+        connection.rollback()
+        connection.execute(text(f"DROP TABLE IF EXISTS {sombra}"))
+        connection.commit()
+        planes_carga[sombra] = None
+        print(f"Tabla {sombra} descartada; la tabla '{nombre_tabla.upper()}' no se modificó.")
+    except SQLAlchemyError as e:
+        print(f"Error al descartar la tabla {sombra}: {e}")
+
+def armar_insert(columnas, nombre_tabla):
+    # INSERT de insertar_lotes para las columnas de un archivo
+    valores_sql = ", ".join([f":{col}" for col in columnas])
+    return text(f"""
+        INSERT INTO {nombre_tabla} ({", ".join(columnas)})
+        VALUES ({valores_sql});
+    """)
+
+def insertar_lotes(connection, df, nombre_tabla, lot_size):
+    # Insertar los datos en lotes (sin lógica de update, ya que se hizo drop-create); el INSERT se arma una sola
+    # vez por tabla y columnas, en el plan de carga
+    columnas = list(df.columns)
+    sql = sentencia_plan(obtener_plan(nombre_tabla), ("insert", tuple(columnas)), lambda: armar_insert(columnas, nombre_tabla))
+    for i in range(0, len(df), lot_size):
+        batch = df.iloc[i:i + lot_size]
+        valores = batch.to_dict(orient='records')
+
+        inicio = time.perf_counter()
+        connection.execute(sql, valores)
+        registrar_lote(time.perf_counter() - inicio)
+
+def insertar_dbapi(connection, df, nombre_tabla):
+    """
+    INSERT multi-fila enviado directamente al driver (sin text() ni un diccionario por fila): los valores se
+    toman de los arrays de las columnas y cada sentencia lleva tantas filas como entran en max_allowed_packet.
+    """
+    if df.empty:
+        return
+    columnas = list(df.columns)
+    prefijo, fila_sql = sentencia_plan(obtener_plan(nombre_tabla), ("dbapi", tuple(columnas)), lambda: (
+        f"INSERT INTO {nombre_tabla} ({', '.join(columnas)}) VALUES ", "(" + ", ".join(["%s"] * len(columnas)) + ")"))
+    valores = df.to_numpy(dtype=object)
+    filas_por_lote = calcular_filas_por_lote(valores, obtener_max_allowed_packet(connection))
+    for i in range(0, len(valores), filas_por_lote):
+        lote = valores[i:i + filas_por_lote]
+        sql = prefijo + ", ".join([fila_sql] * len(lote))
+        inicio = time.perf_counter()
+        connection.exec_driver_sql(sql, tuple(lote.ravel().tolist()))
+        registrar_lote(time.perf_counter() - inicio)
+
+def motor_insercion():
+    # Motor con el que se insertan los bloques (el nombre con el que se registra su rendimiento)
+    return "dbapi" if MOTOR_CARGA == "dbapi" else "insert"
+
+def enviar_bloque(connection, df, tabla_destino, lot_size):
+    # Insertar un bloque con el motor elegido
+    if motor_insercion() == "dbapi":
+        insertar_dbapi(connection, df, tabla_destino)
+    else:
+        insertar_lotes(connection, df, tabla_destino, lot_size)
+
+def insertar_bloque(connection, df, tabla_destino, lot_size):
+    # Insertar un bloque con el motor elegido y registrar su rendimiento
+    inicio = time.perf_counter()
+    enviar_bloque(connection, df, tabla_destino, lot_size)
+    segundos = time.perf_counter() - inicio
+    registrar_rendimiento(motor_insercion(), len(df), segundos)
+    registrar_etapa("insercion", segundos, filas=len(df))
+
+def numero_particion(df, pk, particiones):
+    # Partición de cada fila: con PARTITION BY HASH(pk) MySQL ubica la fila en la partición MOD(pk, particiones)
+    return np.abs(df[pk].to_numpy(dtype=np.int64)) % particiones
+
+def insertar_particiones(conexiones, pool, df, tabla_destino, particion, particiones, lot_size):
+    """
+    Inserta un bloque repartido por partición (`particion` es la de cada fila, ver numero_particion): el worker i,
+    con su conexión y su transacción (conexiones[i]), inserta las filas de las particiones i, i + len(conexiones),
+    ..., así dos workers nunca escriben en la misma partición (ni en el mismo árbol de índices). Espera a que
+    terminen todos los workers antes de devolver o de lanzar el error de alguno. El rendimiento y la etapa de
+    inserción se registran una vez por bloque, con el tiempo transcurrido y no con la suma de los workers.
+    """
+    inicio = time.perf_counter()
+    orden = np.argsort(particion, kind="stable")
+    partes = np.split(orden, np.cumsum(np.bincount(particion, minlength=particiones))[:-1])
+    archivo = getattr(contexto_hilo, "archivo", None)
+
+    def insertar(numero):
+        contexto_hilo.archivo = archivo
+        for filas in partes[numero::len(conexiones)]:
+            if len(filas):
+                enviar_bloque(conexiones[numero], df.take(filas), tabla_destino, lot_size)
+
+    futuros = [pool.submit(insertar, numero) for numero in range(len(conexiones))]
+    wait(futuros)
+    for futuro in futuros:
+        futuro.result()
+    segundos = time.perf_counter() - inicio
+    registrar_rendimiento(motor_insercion(), len(df), segundos)
+    registrar_etapa("insercion", segundos, filas=len(df))
+
+def confirmar_particiones(conexiones, nombre_tabla):
+    """
+    Confirma la transacción de cada worker de particiones al terminar el archivo. Las confirmaciones son una tras
+    otra y no atómicas: si una falla, las anteriores ya quedaron en la tabla. El error se relanza para que el
+    archivo figure con error; la tabla sombra se descarta y, sin TABLA_SOMBRA, la tabla queda con parte del
+    archivo hasta la próxima carga, que la vuelve a crear.
+    """
+    for numero, conexion in enumerate(conexiones):
+        try:
+            conexion.commit()
+        except SQLAlchemyError:
+            print(f"Confirmadas {numero} de {len(conexiones)} conexiones de particiones de la tabla '{nombre_tabla.upper()}' "
+                  f"antes del error: la tabla queda con parte del archivo.")
+            raise
+
+def obtener_max_allowed_packet(connection):
+    # Tamaño máximo de sentencia que acepta el servidor (se consulta una sola vez por ejecución)
+    global max_allowed_packet
+    if max_allowed_packet is None:
+        max_allowed_packet = int(connection.execute(text("SELECT @@max_allowed_packet")).scalar())
+    return max_allowed_packet
+
+def calcular_filas_por_lote(valores, tamano_paquete, max_filas=50000):
+    """
+    Cantidad de filas por sentencia para que un INSERT multi-fila no supere max_allowed_packet. Se mide el ancho
+    en bytes (con comillas, separadores y escapes) de una muestra de filas repartida en todo el bloque y se usa el
+    de la fila más ancha, dejando la mitad del paquete como margen.
+    """
+    if len(valores) == 0:
+        return 1
+    muestra = valores[::max(1, len(valores) // 1000)]
+    ancho_fila = max(sum(len(str(valor).encode("utf-8")) + 4 for valor in fila) + 4 for fila in muestra)
+    return max(1, min(max_filas, tamano_paquete // 2 // ancho_fila))
+
+def usar_load_data():
+    # LOAD DATA LOCAL INFILE solo se usa si se pidió y el servidor tiene local_infile habilitado
+    global local_infile_habilitado
+    # LOAD DATA carga desde el _limpio.TXT sin comprimir (LIMPIO=txt), en una sola sentencia que no se puede
+    # confirmar por partes (REANUDABLE=1) y sin revisar las claves en los DataFrames (CLAVES_DUPLICADAS)
+    if MOTOR_CARGA != "load_data" or LIMPIO != "txt" or REANUDABLE or CLAVES_DUPLICADAS != "no":
+        return False
+    if local_infile_habilitado is None:
+        try:
+            with engine.connect() as connection:
+                local_infile_habilitado = bool(connection.execute(text("SELECT @@GLOBAL.local_infile")).scalar())
+        except SQLAlchemyError as e:
+            print(f"No se pudo consultar local_infile en el servidor: {e}")
+            local_infile_habilitado = False
+        if not local_infile_habilitado:
+            print("El servidor tiene local_infile deshabilitado: se usa el INSERT por lotes.")
+    return local_infile_habilitado
+
+def cargar_con_load_data(connection, ruta_limpio, columnas, nombre_tabla, pk, tipos):
+    """
+    Carga el archivo limpio (UTF-8, separado por tabulaciones, con encabezado) con LOAD DATA LOCAL INFILE.
+    Los valores, ya recortados en el archivo limpio, se convierten según el tipo de cada columna (la clave
+    primaria a entero), igual que en convertir_a_formato_tabla. Devuelve la cantidad de filas cargadas.
+    """
+    variables = [f"@c{i}" for i in range(len(columnas))]
+    asignaciones = [expresion_load_data(columna, variable, tipos[columna], columna == pk)
+                    for columna, variable in zip(columnas, variables)]
+
+    # Con LOCAL, las filas con clave duplicada o valores inválidos se descartan con un aviso en lugar de abortar
+    sql = text(f"""
+        LOAD DATA LOCAL INFILE :ruta
+        INTO TABLE {nombre_tabla}
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY '\\t' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+        LINES TERMINATED BY '\\r\\n'
+        IGNORE 1 LINES
+        ({", ".join(variables)})
+        SET {", ".join(asignaciones)};
+    """)
+    resultado = connection.execute(sql, {"ruta": os.path.abspath(ruta_limpio)})
+    return resultado.rowcount
+
+def registrar_rendimiento(motor, filas, segundos):
+    with bloqueo_estadisticas:
+        if motor not in rendimiento_motores:
+            rendimiento_motores[motor] = {"filas": 0, "segundos": 0.0}
+        rendimiento_motores[motor]["filas"] += filas
+        rendimiento_motores[motor]["segundos"] += segundos
+
+def cargar_datos_en_bd(datos, nombre_tabla, lot_size=1000, ruta_limpio=None, perfiles=None, checkpoint=None):
     """
     Esta función elimina (DROP) la tabla si existe, la crea de nuevo (CREATE) usando la lógica:
       - Para 'personas_domicilios': se utiliza 'id_domicilio' si está presente, sino 'codigo'.
       - Para las demás: si existe 'id_persona' se usa; sino se utiliza 'codigo'.
     Luego inserta todos los registros (sin update).
+    `datos` puede ser un DataFrame o un iterable de DataFrames (bloques) con las mismas columnas:
+    la tabla se crea a partir del primer bloque y todos se insertan en la misma transacción.
+    Con MOTOR_CARGA="dbapi" las filas se insertan con insertar_dbapi en lugar de insertar_lotes.
+    Si se indica `ruta_limpio` y MOTOR_CARGA es "load_data" (con local_infile habilitado en el servidor),
+    las filas se cargan desde ese archivo con LOAD DATA LOCAL INFILE y `datos` solo define las columnas.
+    Con INFERIR_TIPOS=1 los tipos se infieren de `perfiles` (o del primer bloque si no se indican) y se
+    amplían si un bloque posterior no entra en ellos.
+    Con TABLA_SOMBRA=1 las filas se cargan en la tabla sombra y la tabla actual se reemplaza recién cuando la
+    carga terminó bien (ver publicar_sombra); si falla, la sombra se descarta y la tabla actual no cambia.
+    Con PIPELINE=1 los bloques se preparan en otro hilo (ver bloques_en_paralelo) mientras se inserta el anterior;
+    un DataFrame completo se divide en bloques de TAMANO_BLOQUE filas para solapar su conversión con la inserción.
+    Con `checkpoint` (REANUDABLE=1) las filas se cargan en la tabla sombra y se confirman cada LOTES_POR_COMMIT
+    lotes junto con el checkpoint; si el checkpoint indica filas ya confirmadas, la tabla sombra no se vuelve a
+    crear y esas filas se omiten. Si la carga falla, la tabla sombra y el checkpoint quedan para reanudarla (salvo
+    que falle la publicación de la sombra, que la descarta).
+    Con CLAVES_DUPLICADAS las filas con la clave repetida o inválida se apartan antes de crear la tabla (ver
+    depurar_claves); con un DataFrame completo los repetidos se resuelven sobre todo el archivo.
+    Si la tabla se crea particionada (PARTICIONES=1) cada bloque se reparte por partición entre WORKERS_PARTICIONES
+    conexiones (ver insertar_particiones), que confirman al terminar el archivo (ver confirmar_particiones).
     """
     connection = None
+    trans = None
+    pipeline = None
+    conexiones = []
+    pool_particiones = None
+    filas_por_particion = None
+    sombra = TABLA_SOMBRA or checkpoint is not None
+    tabla_destino = nombre_sombra(nombre_tabla) if sombra else nombre_tabla
+    reanudar = bool(checkpoint and checkpoint["filas"])
+    publicando = False
+    filas_archivo = 0
     try:
         connection = engine.connect()
         trans = connection.begin()
+        if checkpoint and not reanudar:
+            # Registrar el comienzo de la carga antes de crear la tabla sombra, para que un checkpoint anterior de
+            # la tabla (de otro archivo o de otro contenido) no se aplique sobre ella
+            trans = confirmar_checkpoint(connection, trans, checkpoint, 0)
 
-        # Convertir nombres de columnas a minúsculas
-        df.columns = df.columns.str.lower()
-
-        inspector = inspect(engine)
-        # Eliminar la tabla si existe
-        if inspector.has_table(nombre_tabla):
-            connection.execute(text(f"DROP TABLE {nombre_tabla}"))
-            print(f"Tabla {nombre_tabla} eliminada.")
-
-        # Determinar la clave primaria (y unique) según las reglas
-        if nombre_tabla == "personas_domicilios":
-            pk = "id_domicilio" if ("id_domicilio" in df.columns or "id_domicilios" in df.columns) else "codigo"
-        elif "id_persona" in df.columns:
-            pk = "id_persona"
+        completo = isinstance(datos, pd.DataFrame)
+        if CLAVES_DUPLICADAS != "no":
+            depuradas = depurar_claves([datos] if completo else datos, nombre_tabla, getattr(contexto_hilo, "archivo", None))
+            datos = next(depuradas) if completo else depuradas
+        if completo and PIPELINE and not (ruta_limpio and usar_load_data()):
+            # Los tipos se infieren igual sobre todo el archivo, no solo sobre el primer bloque
+            if INFERIR_TIPOS and perfiles is None:
+                datos.columns = datos.columns.str.lower()
+                with medir_etapa("inferencia_tipos") as medicion:
+                    perfiles = perfilar_bloque(datos)
+                    medicion["filas"] = len(datos)
+            bloques = dividir_en_bloques(datos)
         else:
-            pk = "codigo"
-
-        # Crear la tabla con la definición de columnas
-        metadata = MetaData()
-        columns = []
-        for name in df.columns:
-            if name == pk:
-                # Se marca como PRIMARY KEY y UNIQUE según lo requerido.
-                columns.append(Column(name, Integer, primary_key=True, unique=True))
-            else:
-                columns.append(Column(name, String(255)))
-        table = Table(nombre_tabla, metadata, *columns)
-        metadata.create_all(engine)
-        print(f"Tabla {nombre_tabla} creada.")
+            bloques = [datos] if completo else datos
+        # Los tipos se amplían por bloque solo si la tabla se creó con los del primer bloque (STREAMING=1); en ese
+        # caso la conversión de cada bloque tiene que esperar a la ampliación y no se adelanta en el productor
+        ampliar = INFERIR_TIPOS and not completo
+        convertir_antes = PIPELINE and not ampliar
+        tabla_lista = threading.Event()
+        if PIPELINE:
+            preparar = (lambda df: convertir_bloque(df, tabla_destino)) if convertir_antes else None
+            bloques = pipeline = bloques_en_paralelo(bloques, preparar, tabla_lista)
 
-        # Convertir DataFrame (opcional) al formato correcto según la tabla
-        df = convertir_a_formato_tabla(df, nombre_tabla)
+        for numero_bloque, df in enumerate(bloques):
+            # Convertir nombres de columnas a minúsculas
+            df.columns = df.columns.str.lower()
+
+            if numero_bloque == 0:
+                if reanudar:
+                    # La tabla sombra ya tiene las filas confirmadas antes de la interrupción (con los tipos y, si
+                    # se amplían por bloque, los perfiles registrados en el checkpoint)
+                    pk = elegir_pk(df.columns, nombre_tabla)
+                    plan = obtener_plan(tabla_destino)
+                    tipos = plan["tipos"]
+                    planes_carga[tabla_destino] = armar_plan(pk, tipos, plan["particiones"])
+                    perfiles = checkpoint["perfiles"] or (perfilar_bloque(df) if ampliar else None)
+                else:
+                    with medir_etapa("creacion_tabla"):
+                        pk, tipos, perfiles = crear_tabla(connection, df, nombre_tabla, perfiles, sombra=sombra, parcial=ampliar)
+                tabla_lista.set()
 
-        # Insertar los datos en lotes (sin lógica de update, ya que se hizo drop-create)
-        for i in range(0, len(df), lot_size):
-            batch = df.iloc[i:i + lot_size]
-            valores = batch.to_dict(orient='records')
+                if ruta_limpio and usar_load_data():
+                    inicio = time.perf_counter()
+                    filas_cargadas = cargar_con_load_data(connection, ruta_limpio, list(df.columns), tabla_destino, pk, tipos)
+                    segundos = time.perf_counter() - inicio
+                    registrar_rendimiento("load_data", filas_cargadas, segundos)
+                    registrar_etapa("insercion", segundos, filas=filas_cargadas)
+                    registrar_lote(segundos)
+                    print(f"Filas cargadas con LOAD DATA: {filas_cargadas}")
+                    break
 
-            columnas = ", ".join(batch.columns)
-            valores_sql = ", ".join([f":{col}" for col in batch.columns])
-            sql = text(f"""
-                INSERT INTO {nombre_tabla} ({columnas})
-                VALUES ({valores_sql});
-            """)
-            connection.execute(sql, valores)
+                particiones = obtener_plan(tabla_destino)["particiones"]
+                if particiones and pk in df.columns:
+                    filas_por_particion = np.zeros(particiones, dtype=np.int64)
+                    # Workers por partición salvo con REANUDABLE=1 (los checkpoints se confirman en esta conexión)
+                    # o si los tipos se amplían por bloque (el ALTER TABLE esperaría a las transacciones de los workers)
+                    if not checkpoint and not ampliar:
+                        conexiones = [engine.connect() for _ in range(min(WORKERS_PARTICIONES, particiones))]
+                        pool_particiones = ThreadPoolExecutor(max_workers=len(conexiones))
+            if ampliar and (numero_bloque > 0 or reanudar):
+                # Al reanudar también el primer bloque, que puede traer filas que no entran en los tipos registrados
+                with medir_etapa("creacion_tabla"):
+                    ampliar_tipos(connection, df, nombre_tabla, pk, perfiles, tipos, tabla_destino)
 
+            # Convertir DataFrame (opcional) al formato correcto según la tabla, si no lo hizo ya el productor
+            if numero_bloque == 0 or not convertir_antes:
+                df = convertir_bloque(df, tabla_destino)
+
+            particion = None
+            if filas_por_particion is not None:
+                particion = numero_particion(df, pk, len(filas_por_particion))
+                filas_por_particion += np.bincount(particion, minlength=len(filas_por_particion))
+
+            if checkpoint:
+                # Omitir las filas ya confirmadas e insertar el resto confirmando cada LOTES_POR_COMMIT lotes
+                inicio_bloque = filas_archivo
+                filas_archivo += len(df)
+                omitidas = min(max(checkpoint["filas"] - inicio_bloque, 0), len(df))
+                filas_por_commit = LOTES_POR_COMMIT * lot_size
+                for inicio in range(omitidas, len(df), filas_por_commit):
+                    parte = df.iloc[inicio:inicio + filas_por_commit]
+                    insertar_bloque(connection, parte, tabla_destino, lot_size)
+                    trans = confirmar_checkpoint(connection, trans, checkpoint, inicio_bloque + inicio + len(parte),
+                                                 perfiles if ampliar else None)
+            elif conexiones:
+                insertar_particiones(conexiones, pool_particiones, df, tabla_destino, particion, len(filas_por_particion), lot_size)
+            else:
+                insertar_bloque(connection, df, tabla_destino, lot_size)
+
+        confirmar_particiones(conexiones, nombre_tabla)
+        if checkpoint:
+            # La carga terminó: el checkpoint se borra con las últimas filas, antes de publicar la sombra
+            borrar_checkpoint(connection, nombre_tabla)
         trans.commit()
+        # Confirmada: si la publicación falla no hay nada que deshacer (publicar_sombra descarta la sombra)
+        trans = None
+        if sombra:
+            publicando = True
+            publicar_sombra(connection, nombre_tabla, pk)
+        if filas_por_particion is not None:
+            with bloqueo_estadisticas:
+                filas_particiones[nombre_tabla] = filas_por_particion.tolist()
         print(f"Datos cargados en la tabla '{nombre_tabla.upper()}'.")
         return True
 
-    except SQLAlchemyError as e:
+    except (SQLAlchemyError, ValueError) as e:
+        # ValueError: un valor que no entra en el tipo de su columna (ver convertir_columna)
+        for conexion in conexiones:
+            conexion.rollback()
         if trans:
             trans.rollback()
         print(f"Error al insertar datos en la tabla '{nombre_tabla.upper()}': {e}")
+        # Si falló la publicación, publicar_sombra ya descartó la sombra
+        if checkpoint and checkpoint["filas"] and not publicando:
+            # La tabla sombra conserva las filas confirmadas: la próxima ejecución reanuda la carga desde ahí
+            print(f"Filas de {checkpoint['archivo']} confirmadas hasta el error: {checkpoint['filas']}.")
+        elif sombra and connection and not publicando:
+            descartar_sombra(connection, nombre_tabla)
         return False
 
     finally:
+        if pipeline:
+            pipeline.close()
+        if pool_particiones:
+            pool_particiones.shutdown()
+        for conexion in conexiones:
+            conexion.close()
         if connection:
             connection.close()
 
-# Ejecutar el proceso
-procesar_y_cargar_archivos(PATH)
+# Ejecutar el proceso (solo al correr el script, no al importarlo desde benchmark.py)
+if __name__ == "__main__":
+    procesar_y_cargar_archivos(PATH)
@@ -0,0 +1,297 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import carga
+
+# Perfil de los archivos a cargar, sin conectarse a la base: recorre los archivos de la carpeta igual que carga.py
+# (incluidos los que vienen en un .zip o .gz) e informa por archivo la codificación, las filas, las líneas vacías,
+# las filas irregulares (con menos o más columnas que el encabezado, que la carga completa o recorta), el porcentaje
+# de valores vacíos y el largo máximo de cada columna, y si la clave que elige carga.py se repite o es inválida.
+# Los archivos grandes se dividen en rangos de bytes cortados en un salto de línea que se recorren en paralelo en
+# varios procesos; los comprimidos se recorren en un solo proceso, porque no se pueden empezar a leer por la mitad.
+#
+# Ejemplos:
+#   python perfil.py
+#   python perfil.py --carpeta Ruta/A/archivos --procesos 8 --rango 32 --salida perfil.json
+
+# Bytes que lee cada proceso por vez dentro de su rango
+TAMANO_LECTURA = 4 * 1024 * 1024
+
+# Claves repetidas que se muestran como ejemplo por archivo
+EJEMPLOS_CLAVES = 10
+
+def leer_encabezado(ruta_archivo, encoding):
+    # Columnas del encabezado (sin espacios y en minúsculas, como en la carga) y bytes que ocupa, o (None, 0) si el archivo está vacío
+    # La primera línea se separa con carga.separar_encabezado, que también corta en los demás fines de línea de
+    # str.splitlines (OTROS_FINES_DE_LINEA), así las columnas son las mismas que en la carga
+    with carga.abrir_archivo(ruta_archivo) as f:
+        bloque = next(carga.bloques_de_lineas(f, TAMANO_LECTURA), b"")
+    texto, encoding = carga.decodificar_bloque(bloque, encoding)
+    header, textos = carga.separar_encabezado(iter([texto]))
+    if header is None:
+        return None, 0
+    linea = texto[:len(texto) - len(next(textos))]
+    if not linea.strip():
+        return None, 0
+    return list(pd.Index(header).str.strip().str.lower()), len(linea.encode(encoding))
+
+def dividir_en_rangos(ruta_archivo, inicio, tamano_rango):
+    """
+    Divide el archivo desde el byte `inicio` en rangos de unos `tamano_rango` bytes. Cada corte se corre hasta el
+    comienzo de la línea siguiente, así ninguna línea queda repartida entre dos rangos.
+    """
+    tamano = os.path.getsize(ruta_archivo)
+    cortes = [inicio]
+    with open(ruta_archivo, 'rb') as f:
+        while cortes[-1] + tamano_rango < tamano:
+            f.seek(cortes[-1] + tamano_rango - 1)
+            f.readline()
+            if f.tell() >= tamano:
+                break
+            cortes.append(f.tell())
+    cortes.append(tamano)
+    return list(zip(cortes[:-1], cortes[1:]))
+
+def leer_rango(ruta_archivo, comprimido, inicio, fin):
+    # Genera los bytes del rango en bloques de líneas completas (fin=None: hasta el final del archivo)
+    with carga.abrir_archivo(ruta_archivo) as f:
+        if comprimido:
+            f.read(inicio)
+        else:
+            f.seek(inicio)
+        yield from carga.bloques_de_lineas(f, TAMANO_LECTURA, None if fin is None else fin - inicio)
+
+def contar_campos(texto):
+    """
+    Campos de cada línea del bloque (tabulaciones + 1), con las líneas separadas igual que en carga.parsear_texto
+    (\r\n, \r, \n y los demás fines de línea de str.splitlines), así hay uno por cada fila del DataFrame.
+    """
+    texto = re.sub(f"\r\n|[\r{carga.OTROS_FINES_DE_LINEA}]", "\n", texto)
+    caracteres = np.frombuffer(texto.encode("utf-32-le"), dtype=np.uint32)
+    finales = np.flatnonzero(caracteres == ord("\n"))
+    if texto and not texto.endswith("\n"):
+        finales = np.append(finales, len(caracteres))
+    tabulaciones = np.searchsorted(np.flatnonzero(caracteres == ord("\t")), finales)
+    return np.diff(tabulaciones, prepend=0) + 1
+
+def perfilar_texto(texto, columnas, clave, entera, perfil, claves):
+    # Acumula en `perfil` las estadísticas de un bloque de líneas completas y agrega a `claves` sus claves válidas
+    df = carga.parsear_texto(texto, len(columnas))
+    perfil["filas"] += len(df)
+    recortados = {}
+    for i in range(len(columnas)):
+        recortados[i] = df[i].str.strip()
+        largos = recortados[i].str.len().to_numpy()
+        perfil["nulos"][i] += int((largos == 0).sum())
+        if len(largos):
+            perfil["largo_max"][i] = max(perfil["largo_max"][i], int(largos.max()))
+
+    # Una línea vacía (o con solo espacios) no tiene tabulaciones y su único campo queda vacío
+    campos = contar_campos(texto)
+    vacias = (campos == 1) & (recortados[0] == "").to_numpy()
+    perfil["lineas_vacias"] += int(vacias.sum())
+    perfil["cortas"] += int((~vacias & (campos < len(columnas))).sum())
+    perfil["largas"] += int((campos > len(columnas)).sum())
+
+    if clave is None:
+        return
+    valores = recortados[columnas.index(clave)]
+    if entera:
+        # Mismo criterio que depurar_bloque: una clave entera que no es un número entero es inválida
+        numeros = pd.to_numeric(valores, errors='coerce')
+        invalidas = (numeros.isna() | (numeros % 1 != 0)).to_numpy()
+        if invalidas.any():
+            numeros = pd.to_numeric(valores[~invalidas])
+        claves.append(numeros.to_numpy().astype(np.int64))
+    else:
+        invalidas = (valores == "").to_numpy()
+        claves.append(valores[~invalidas].to_numpy())
+    perfil["claves_invalidas"] += int(invalidas.sum())
+
+def perfilar_rango(ruta_archivo, comprimido, inicio, fin, encoding, columnas, clave, entera):
+    """
+    Perfil de las líneas entre los bytes `inicio` y `fin` del archivo. Se ejecuta en otro proceso: `comprimido` es
+    la entrada de carga.archivos_comprimidos del archivo si viene en un .zip o .gz (que se lee desde el principio).
+    Devuelve los contadores del rango, las codificaciones usadas, sus claves válidas ordenadas y los segundos.
+    """
+    inicio_rango = time.perf_counter()
+    if comprimido:
+        carga.archivos_comprimidos[ruta_archivo] = comprimido
+    perfil = {"filas": 0, "lineas_vacias": 0, "cortas": 0, "largas": 0, "claves_invalidas": 0,
+              "nulos": [0] * len(columnas), "largo_max": [0] * len(columnas), "codificaciones": set()}
+    claves = []
+    for datos in leer_rango(ruta_archivo, comprimido, inicio, fin):
+        texto, encoding = carga.decodificar_bloque(datos, encoding)
+        perfil["codificaciones"].add(encoding)
+        perfilar_texto(texto, columnas, clave, entera, perfil, claves)
+    perfil["codificaciones"] = sorted(perfil["codificaciones"])
+    perfil["segundos"] = time.perf_counter() - inicio_rango
+    if clave is not None:
+        perfil["claves"] = np.sort(np.concatenate(claves), kind="stable") if claves else np.array([], dtype=np.int64 if entera else object)
+    return perfil
+
+def analizar_claves(claves):
+    """
+    Repetición de las claves de todos los rangos de un archivo. Cada rango las devuelve ordenadas, así que al
+    concatenarlas el ordenamiento estable (timsort) solo intercala los tramos, y los repetidos quedan contiguos.
+    """
+    todas = np.concatenate(claves)
+    todas.sort(kind="stable")
+    repetida = todas[1:] == todas[:-1]
+    # Primera repetición de cada clave: una por clave repetida, sin importar cuántas veces aparezca
+    primeras = repetida & ~np.concatenate(([False], repetida[:-1]))
+    return {
+        "distintas": int(len(todas) - repetida.sum()),
+        "filas_repetidas": int(repetida.sum()),
+        "claves_repetidas": int(primeras.sum()),
+        "ejemplos": [valor.item() if isinstance(valor, np.generic) else valor for valor in todas[1:][primeras][:EJEMPLOS_CLAVES]],
+    }
+
+def combinar_rangos(resultados, columnas, clave):
+    # Suma los contadores de los rangos de un archivo y arma el perfil por columna y de la clave
+    filas = sum(r["filas"] for r in resultados)
+    perfil = {
+        "codificaciones": sorted({c for r in resultados for c in r["codificaciones"]}),
+        "filas": filas,
+        "segundos": sum(r["segundos"] for r in resultados),
+        "lineas_vacias": sum(r["lineas_vacias"] for r in resultados),
+        "filas_irregulares": {"cortas": sum(r["cortas"] for r in resultados), "largas": sum(r["largas"] for r in resultados)},
+        "columnas": {},
+    }
+    for i, columna in enumerate(columnas):
+        nulos = sum(r["nulos"][i] for r in resultados)
+        perfil["columnas"][columna] = {
+            "nulos": nulos,
+            "porcentaje_nulos": round(100 * nulos / filas, 2) if filas else 0.0,
+            "largo_max": max((r["largo_max"][i] for r in resultados), default=0),
+        }
+    if clave is not None:
+        perfil["clave"] = {"columna": clave, "invalidas": sum(r["claves_invalidas"] for r in resultados),
+                           **analizar_claves([r["claves"] for r in resultados])}
+    else:
+        perfil["clave"] = None
+    return perfil
+
+def planificar_archivo(carpeta, archivo, tamano_rango):
+    """
+    Datos del archivo que se necesitan antes de repartirlo: tabla, codificación, encabezado, clave y los rangos.
+    Devuelve None si el archivo no corresponde a ninguna tabla o está vacío.
+    """
+    nombre_tabla = carga.obtener_tabla(archivo)
+    if not nombre_tabla:
+        return None
+    ruta_archivo = os.path.join(carpeta, archivo)
+    encoding = carga.detectar_codificacion(ruta_archivo, nombre_tabla)
+    if encoding is None:
+        print(f"No se pudo detectar la codificación de {archivo}; se omite.")
+        return None
+    columnas, inicio = leer_encabezado(ruta_archivo, encoding)
+    if columnas is None:
+        print(f"El archivo {archivo} está vacío; se omite.")
+        return None
+
+    clave = carga.elegir_pk(columnas, nombre_tabla)
+    if clave not in columnas:
+        clave = "id_domicilios" if clave == "id_domicilio" and "id_domicilios" in columnas else None
+    comprimido = carga.archivos_comprimidos.get(ruta_archivo)
+    rangos = [(inicio, None)] if comprimido else dividir_en_rangos(ruta_archivo, inicio, tamano_rango)
+    return {
+        "archivo": archivo,
+        "tabla": nombre_tabla,
+        "ruta": ruta_archivo,
+        "comprimido": comprimido,
+        "bytes": carga.tamano_archivo(ruta_archivo),
+        "codificacion": encoding,
+        "columnas": columnas,
+        "clave": clave,
+        "entera": clave is not None and carga.clave_entera(nombre_tabla, clave),
+        "rangos": rangos,
+    }
+
+def entero_positivo(valor):
+    # Tipo de argparse para --rango y --procesos: un rango de 0 MB no avanza nunca
+    numero = int(valor)
+    if numero <= 0:
+        raise argparse.ArgumentTypeError(f"debe ser un entero mayor que 0: {valor}")
+    return numero
+
+def imprimir_perfil(perfil):
+    mb = perfil["bytes"] / (1024 * 1024)
+    # Los segundos son la suma de los de cada rango: los MB/s son los de un solo proceso
+    print(f"\n{perfil['archivo']} -> {perfil['tabla']} ({mb:.1f} MB, {perfil['rangos']} rango(s), {perfil['segundos']:.2f} s, "
+          f"{mb / perfil['segundos'] if perfil['segundos'] else 0:.1f} MB/s por proceso)")
+    print(f"  Codificación: {perfil['codificacion']}"
+          + (f" (también {', '.join(c for c in perfil['codificaciones'] if c != perfil['codificacion'])})"
+             if set(perfil["codificaciones"]) - {perfil["codificacion"]} else ""))
+    irregulares = perfil["filas_irregulares"]
+    print(f"  Filas: {perfil['filas']} | líneas vacías: {perfil['lineas_vacias']} | "
+          f"filas cortas: {irregulares['cortas']} | filas largas: {irregulares['largas']}")
+    clave = perfil["clave"]
+    if clave is None:
+        print("  Clave: el archivo no tiene la columna de la clave")
+    else:
+        print(f"  Clave {clave['columna']}: {clave['distintas']} distintas, {clave['claves_repetidas']} repetidas "
+              f"({clave['filas_repetidas']} filas de más), {clave['invalidas']} inválidas")
+        if clave["ejemplos"]:
+            print(f"    Ejemplos de claves repetidas: {', '.join(str(valor) for valor in clave['ejemplos'])}")
+    print("  Columna: % vacíos, largo máximo")
+    for columna, datos in perfil["columnas"].items():
+        print(f"    {columna}: {datos['porcentaje_nulos']:.2f}%, {datos['largo_max']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil de los archivos a cargar (filas, codificación, vacíos, claves) sin conectarse a la base")
+    parser.add_argument("--carpeta", default=carga.PATH, help="carpeta de los archivos (por defecto PATH del .env)")
+    parser.add_argument("--procesos", type=entero_positivo, default=os.cpu_count() or 1, help="procesos que recorren los rangos en paralelo")
+    parser.add_argument("--rango", type=entero_positivo, default=64, help="tamaño en MB de los rangos en que se divide cada archivo")
+    parser.add_argument("--salida", help="archivo JSON donde guardar el perfil (por defecto <carpeta>/perfil_<fecha>.json)")
+    args = parser.parse_args()
+
+    if not args.carpeta or not os.path.isdir(args.carpeta):
+        print(f"La carpeta {args.carpeta} no existe.")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    planes = [plan for plan in (planificar_archivo(args.carpeta, archivo, args.rango * 1024 * 1024)
+                                for archivo in carga.listar_archivos(args.carpeta)) if plan]
+    if not planes:
+        print("No hay archivos para perfilar.")
+        return
+
+    # Todos los rangos de todos los archivos van a los mismos procesos, empezando por los archivos más grandes
+    perfiles = []
+    with ProcessPoolExecutor(max_workers=args.procesos) as procesos:
+        tareas = []
+        for plan in sorted(planes, key=lambda plan: plan["bytes"], reverse=True):
+            tareas.append((plan, [
+                procesos.submit(perfilar_rango, plan["ruta"], plan["comprimido"], desde, hasta, plan["codificacion"],
+                                plan["columnas"], plan["clave"], plan["entera"])
+                for desde, hasta in plan["rangos"]]))
+        for plan, futuros in tareas:
+            perfil = combinar_rangos([futuro.result() for futuro in futuros], plan["columnas"], plan["clave"])
+            perfiles.append({"archivo": plan["archivo"], "tabla": plan["tabla"], "bytes": plan["bytes"],
+                             "codificacion": plan["codificacion"], "rangos": len(plan["rangos"]), **perfil})
+
+    perfiles.sort(key=lambda perfil: perfil["archivo"])
+    for perfil in perfiles:
+        imprimir_perfil(perfil)
+    total = time.perf_counter() - inicio
+    print(f"\n{len(perfiles)} archivo(s), {sum(p['filas'] for p in perfiles)} filas, "
+          f"{sum(p['bytes'] for p in perfiles) / (1024 * 1024):.1f} MB en {total:.2f} s ({args.procesos} procesos)")
+
+    salida = args.salida or os.path.join(args.carpeta, f"perfil_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump({"fecha": datetime.now().isoformat(timespec="seconds"), "carpeta": args.carpeta,
+                   "segundos": total, "archivos": perfiles}, f, ensure_ascii=False, indent=2)
+    print(f"Perfil guardado en {salida}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Conversión de las columnas según su plan de carga (convertir_columna) en carga.py y update.py.
+Correr con: python -m unittest discover tests
+"""
+import unittest
+
+import pandas as pd
+
+from test_parseo import cargar_script
+
+
+class ConversionColumnas(unittest.TestCase):
+    scripts = ("carga.py", "update.py")
+
+    @classmethod
+    def setUpClass(cls):
+        cls.modulos = {script: cargar_script(script) for script in cls.scripts}
+
+    def test_entero_bigint_con_vacios(self):
+        # Un BIGINT de 18 dígitos (el máximo que infiere perfilar_columna) junto a un vacío no pasa por float
+        for valores, esperado in ((["123456789012345678", "", "7"], [123456789012345678, None, 7]),
+                                  (["123456789012345678", "7"], [123456789012345678, 7]),
+                                  (["", ""], [None, None])):
+            for script, modulo in self.modulos.items():
+                with self.subTest(script=script, valores=valores):
+                    serie = pd.Series(valores, dtype=object, name="codigo")
+                    convertida = modulo.convertir_columna(serie, "entero")
+                    self.assertEqual(convertida.tolist(), esperado)
+                    self.assertEqual([type(valor) for valor in convertida], [type(valor) for valor in esperado])
+
+    def test_entero_invalido(self):
+        # Un valor que no es entero hace fallar el archivo en lugar de cargarse como NULL
+        for script, modulo in self.modulos.items():
+            with self.subTest(script=script):
+                with self.assertRaises(ValueError):
+                    modulo.convertir_columna(pd.Series(["1", "", "1.5"], dtype=object, name="codigo"), "entero")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Paridad del parseo con el lector en C de pandas (leer_textos, separar_encabezado, parsear_texto, armar_bloque y
+escribir_limpio) con el separador de líneas anterior: str.splitlines, split("\t") y ajustar_fila, y el archivo
+limpio escrito con csv.writer. Correr con: python -m unittest discover tests
+"""
+import os
+import csv
+import tempfile
+import unittest
+import importlib.util
+from unittest import mock
+
+import pandas as pd
+
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Archivos de prueba: filas más cortas y más largas que el encabezado, líneas vacías o con solo espacios, comillas,
+# y los fines de línea que separa str.splitlines
+ARCHIVOS = {
+    "irregular": "id_persona\tnombre\tcodigo\r\n1\tAna\t10\r\n2\tLuis\r\n3\r\n4\tEva\t40\textra\tmas\r\n",
+    "vacias": "id_persona\tnombre\n1\tAna\n\n   \n\t\t\n2\t Luis \t 20 \n\n",
+    "comillas": 'id_persona\tnombre\n1\t"Ana"\n2\tLu"is\n3\t"a\tb"\n4\t""\n',
+    "sin_fin": "id_persona\tnombre\n1\tAna\n2\tLuis",
+    "solo_cr": "id_persona\tnombre\r1\tAna\r\r2\tLuis\r3\r",
+    "mixto": "id_persona\tnombre\r\n1\tAna\r2\tLuis\n3\tEva\r\n\r\n4\tSol",
+    "otros_fines": "id_persona\tnombre\n1\tA\x0bna\n2\tLu\x0cis\n3\tE\x1cva\x1d\n4\tS\x1eol\x85\n5\tX\u2028Y\u2029\n",
+    "nul": "id_persona\tnombre\n1\tA\x00na\n2\t\x00\n\n3\tEva\t\x00\n",
+    "espacios_raros": "id_persona\tnombre\n1\t\xa0Ana\xa0\n\xa0\n2\tLuis\x1f\n",
+    "encabezado": "id_persona\tnombre\n",
+    "encabezado_con_espacios": " id_persona \t Nombre \r\n1\tAna\r\n",
+}
+
+
+def cargar_script(script):
+    # Importar el script con una base SQLite en memoria y sin leer el .env, como benchmark.py; el entorno y
+    # load_dotenv se restauran al terminar, para no afectar a las pruebas que corren después en el mismo proceso
+    with mock.patch.dict(os.environ, {"DB_URL": "sqlite://"}), mock.patch("dotenv.load_dotenv", return_value=False):
+        spec = importlib.util.spec_from_file_location(script[:-3], os.path.join(DIRECTORIO, script))
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+    return modulo
+
+
+def ajustar_fila(row_list, ancho):
+    # El ajuste anterior: recortar las filas más largas y rellenar las más cortas
+    if len(row_list) > ancho:
+        return row_list[:ancho]
+    elif len(row_list) < ancho:
+        return row_list + [''] * (ancho - len(row_list))
+    else:
+        return row_list
+
+
+def parsear_como_antes(contenido, encoding, ruta_limpio):
+    # El separador de líneas anterior: el DataFrame normalizado y el archivo limpio escrito con csv.writer
+    lines = contenido.decode(encoding).splitlines()
+    header = lines[0].strip().split("\t")
+    rows = [[''] * len(header) if line.strip() == "" else ajustar_fila(line.split("\t"), len(header))
+            for line in lines[1:]]
+    with open(ruta_limpio, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f, delimiter="\t")
+        escritor.writerow(header)
+        escritor.writerows(rows)
+    df = pd.DataFrame(rows, columns=header, dtype=object)
+    df.columns = df.columns.str.strip().str.lower()
+    for col in df.columns:
+        df[col] = df[col].str.strip()
+    return df
+
+
+def parsear_con_lector(modulo, ruta_archivo, encoding, tamano_lectura, ruta_limpio):
+    # El parseo actual, bloque por bloque como en procesar_archivo_por_bloques
+    header, textos = modulo.separar_encabezado(modulo.leer_textos(ruta_archivo, encoding, "prueba", tamano_lectura))
+    partes = [modulo.parsear_texto(texto, len(header)) for texto in textos]
+    with modulo.abrir_limpio(ruta_limpio, header) as f_limpio:
+        for parte in partes:
+            modulo.escribir_limpio(f_limpio, parte)
+    bloques = [modulo.armar_bloque(parte, header) for parte in partes]
+    return pd.concat(bloques, ignore_index=True) if bloques else modulo.armar_bloque(modulo.parsear_texto("", len(header)), header)
+
+
+class ParidadParseo(unittest.TestCase):
+    scripts = ("carga.py", "update.py")
+
+    @classmethod
+    def setUpClass(cls):
+        cls.modulos = {script: cargar_script(script) for script in cls.scripts}
+
+    def setUp(self):
+        self.carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(self.carpeta.cleanup)
+
+    def comparar(self, nombre, texto, encoding="windows-1252", tamanos_lectura=(1, 2, 3, 7, 1024 * 1024)):
+        contenido = texto.encode(encoding)
+        ruta_archivo = os.path.join(self.carpeta.name, f"{nombre}.TXT")
+        with open(ruta_archivo, "wb") as f:
+            f.write(contenido)
+        ruta_anterior = os.path.join(self.carpeta.name, f"{nombre}_anterior.TXT")
+        esperado = parsear_como_antes(contenido, encoding, ruta_anterior)
+        with open(ruta_anterior, "rb") as f:
+            limpio_esperado = f.read()
+
+        for script, modulo in self.modulos.items():
+            # Lecturas de pocos bytes para cortar los bloques en todas las posiciones posibles
+            for tamano_lectura in tamanos_lectura:
+                with self.subTest(archivo=nombre, script=script, tamano_lectura=tamano_lectura):
+                    ruta_limpio = os.path.join(self.carpeta.name, f"{nombre}_limpio.TXT")
+                    df = parsear_con_lector(modulo, ruta_archivo, encoding, tamano_lectura, ruta_limpio)
+                    pd.testing.assert_frame_equal(df, esperado)
+                    with open(ruta_limpio, "rb") as f:
+                        self.assertEqual(f.read(), limpio_esperado)
+
+    def test_archivos(self):
+        for nombre, texto in ARCHIVOS.items():
+            self.comparar(nombre, texto, "utf-8")
+
+    def test_windows_1252(self):
+        self.comparar("acentos", "id_persona\tdescripción\r\n1\tañoñuevo\r\n2\tcafé\t\r\n\r\n3\r\n")
+
+    def test_bloques_grandes(self):
+        # Muchas filas irregulares en un archivo de varios bloques de lectura
+        filas = ["\t".join(["x" * (i % 5)] * (i % 6)) if i % 7 else " " * (i % 3) for i in range(5000)]
+        self.comparar("grande", "id_persona\ta\tb\tc\r\n" + "\r\n".join(filas) + "\r\n", tamanos_lectura=(4096, 1024 * 1024))
+
+
+if __name__ == "__main__":
+    unittest.main()